@@ -0,0 +1,89 @@
+"""Running completion/miss counters kept alongside the raw records.
+
+Weekly rollups hold per-user counts for one week; totals hold all-time
+counts and the current/best streak of consecutive completed shifts. Both
+are updated when a completion or miss is recorded, so /stats never has to
+walk the raw history.
+"""
+from datetime import date, timedelta
+
+
+def parse_week(key):
+    """Split a "YYYY-WN" week key into (year, week) ints."""
+    year, week = key.split("-W")
+    return int(year), int(week)
+
+
+def canonical_week(key):
+    """The stored form of a week key typed by hand ("2026-w01" -> "2026-W1")."""
+    year, week = parse_week(key.upper())
+    return f"{year}-W{week}"
+
+
+def week_ordinal(key):
+    """Sortable integer for a week key ("2024-W9" < "2024-W10")."""
+    year, week = parse_week(key)
+    return year * 100 + week
+
+
+def previous_week(key):
+    """Key of the week before key, across year boundaries."""
+    year, week = parse_week(key)
+    year, week, _ = (date.fromisocalendar(year, week, 1) - timedelta(weeks=1)).isocalendar()
+    return f"{year}-W{week}"
+
+
+def week_start_date(key):
+    """ISO date of the Monday starting the week."""
+    return date.fromisocalendar(*parse_week(key), 1).isoformat()
+
+
+def completion_rate(completed, missed):
+    """Percentage of completed shifts, or None when nothing was due."""
+    total = completed + missed
+    return completed / total * 100 if total else None
+
+
+def outcome_slots(week_stats):
+    """(day, slot) of every shift with a completion or miss in a week's stats (may be None)."""
+    if week_stats is None:
+        return set()
+    return {(r["day"], r["time"]) for r in week_stats["completed"] + week_stats["missed"]}
+
+
+def empty_totals():
+    return {"completed": 0, "missed": 0, "streak": 0, "best_streak": 0}
+
+
+def record_outcome(data, week, user, outcome):
+    """Count a "completed" or "missed" shift for user in the JSON state."""
+    rollup = data["rollups"].setdefault(week, {"completed": 0, "missed": 0, "users": {}})
+    rollup[outcome] += 1
+    counts = rollup["users"].setdefault(user, {"completed": 0, "missed": 0})
+    counts[outcome] += 1
+
+    totals = data["totals"].setdefault(user, empty_totals())
+    totals[outcome] += 1
+    if outcome == "completed":
+        totals["streak"] += 1
+        totals["best_streak"] = max(totals["best_streak"], totals["streak"])
+    else:
+        totals["streak"] = 0
+
+
+def rebuild(data):
+    """Recompute rollups and totals from weekly_stats (one-off, on upgrade)."""
+    data["rollups"] = {}
+    data["totals"] = {}
+    for week in sorted(data["weekly_stats"], key=week_ordinal):
+        week_stats = data["weekly_stats"][week]
+        outcomes = [(r.get("timestamp", ""), r["user"], r["day"], r["time"], "completed")
+                    for r in week_stats["completed"]]
+        outcomes += [(r.get("timestamp", ""), r["user"], r["day"], r["time"], "missed")
+                     for r in week_stats["missed"]]
+        # Only the first outcome of a shift counts
+        counted = set()
+        for _, user, day, time, outcome in sorted(outcomes):
+            if (day, time) not in counted:
+                counted.add((day, time))
+                record_outcome(data, week, user, outcome)
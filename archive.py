@@ -0,0 +1,76 @@
+"""Closed weeks moved out of the JSON chat states, one compressed file per week.
+
+JsonRepository.archive_weeks() writes a week's outcome records, rollup and
+schedule to <directory>/<chat_id>/<week>.json.gz before dropping them from
+the chat's snapshot, so the snapshot only holds the weeks still written to.
+Archived weeks are read back on demand through a small LRU.
+"""
+import asyncio
+import gzip
+import json
+import os
+from collections import OrderedDict
+
+from aggregates import week_ordinal
+from metrics import METRICS
+from storage import atomic_write
+
+SUFFIX = ".json.gz"
+
+
+class WeekArchive:
+    def __init__(self, directory, max_weeks=64):
+        self.directory = directory
+        self.max_weeks = max_weeks
+        self._entries = OrderedDict()  # (chat_id, week) -> entry
+
+    def _path(self, chat_id, week):
+        return os.path.join(self.directory, str(chat_id), week + SUFFIX)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_weeks:
+            self._entries.popitem(last=False)
+
+    def weeks(self, chat_id):
+        """Archived week keys of the chat, oldest first."""
+        try:
+            names = os.listdir(os.path.join(self.directory, str(chat_id)))
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-len(SUFFIX)] for name in names if name.endswith(SUFFIX)), key=week_ordinal)
+
+    def _write_file(self, chat_id, week, entry):
+        os.makedirs(os.path.join(self.directory, str(chat_id)), exist_ok=True)
+        data = gzip.compress(json.dumps(entry, separators=(",", ":")).encode())
+        atomic_write(self._path(chat_id, week), data)
+        return len(data)
+
+    async def write(self, chat_id, week, entry):
+        """Store entry ({"stats", "rollup", "schedule"}, each possibly None) for
+        week; compressing and fsyncing the file run in a worker thread."""
+        with METRICS.timer("chorebot_storage_seconds", op="archive_write"):
+            size = await asyncio.to_thread(self._write_file, chat_id, week, entry)
+        METRICS.count("chorebot_storage_bytes_total", size, op="archive_write")
+        self._remember((chat_id, week), entry)
+
+    def load(self, chat_id, week):
+        """The archived entry of week, or None if it was never archived."""
+        key = (chat_id, week)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            METRICS.count("chorebot_archive_cache_total", result="hit")
+            return entry
+        METRICS.count("chorebot_archive_cache_total", result="miss")
+        with METRICS.timer("chorebot_storage_seconds", op="archive_read"):
+            try:
+                with open(self._path(chat_id, week), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None
+            entry = json.loads(gzip.decompress(data))
+        METRICS.count("chorebot_storage_bytes_total", len(data), op="archive_read")
+        self._remember(key, entry)
+        return entry
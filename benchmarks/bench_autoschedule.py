@@ -0,0 +1,119 @@
+"""Compare the auto-scheduling engines on solve time and fairness.
+
+Usage: python benchmarks/bench_autoschedule.py [--sizes 10,100,500,2000] [--slots-per-day 2,6] [--weeks 52]
+                                               [--horizon-sizes 2,7,10,100,500,2000]
+
+The second table plans --weeks weeks at once with plan_weeks() and compares
+it with calling plan() once per week. It fails if two consecutive weeks get
+the same plan; rotations that come back round every week show up with
+member counts dividing the slot count, such as 2 or 7 for 14 slots.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from planner import PLANNERS
+from test import DAYS
+
+
+def build_case(users, slots_per_day, unavailable_rate):
+    usernames = [f"user{i}" for i in range(users)]
+    slots = [(day, f"slot{i}") for day in DAYS for i in range(slots_per_day)]
+    completed = {u: random.randint(0, 50) for u in usernames}
+    unavailable = {(u, day) for u in usernames for day in DAYS if random.random() < unavailable_rate}
+    return usernames, slots, completed, unavailable
+
+
+def score(plan, usernames, unavailable):
+    load = dict.fromkeys(usernames, 0)
+    days = set()
+    doubles = violations = empty = 0
+    for (day, _), username in plan.items():
+        if not username:
+            empty += 1
+            continue
+        load[username] += 1
+        if (username, day) in days:
+            doubles += 1
+        days.add((username, day))
+        if (username, day) in unavailable:
+            violations += 1
+    return {
+        "load stdev": statistics.pstdev(load.values()),
+        "max load": max(load.values()),
+        "same-day doubles": doubles,
+        "unavailable": violations,
+        "empty": empty,
+    }
+
+
+def horizon(planner, users, slots, weeks, completed, unavailable):
+    """(plan_weeks ms, week-by-week ms, min/max shifts per member over the horizon,
+    consecutive weeks with the same plan)"""
+    start = time.perf_counter()
+    plans = planner.plan_weeks(users, slots, weeks, completed, unavailable)
+    batch = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for week in weeks:
+        planner.plan(users, slots, completed, {(u, d) for u, w, d in unavailable if w == week})
+    separate = (time.perf_counter() - start) * 1000
+    load = Counter(u for plan in plans.values() for u in plan.values() if u)
+    plans = [plans[week] for week in weeks]
+    repeats = sum(a == b for a, b in zip(plans, plans[1:]))
+    return batch, separate, min(load.get(u, 0) for u in users), max(load.values()), repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,500,2000")
+    parser.add_argument("--slots-per-day", default="2,6")
+    parser.add_argument("--unavailable", type=float, default=0.1, help="chance a member is out on a day")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--horizon-sizes", default="2,7,10,100,500,2000")
+    args = parser.parse_args()
+
+    header = f"{'engine':<9}{'users':>7}{'slots':>7}{'ms':>10}{'stdev':>8}{'max':>5}{'doubles':>9}{'unavail':>9}{'empty':>7}"
+    print(header)
+    for slots_per_day in map(int, args.slots_per_day.split(",")):
+        for users in map(int, args.sizes.split(",")):
+            random.seed(users * 100 + slots_per_day)
+            case = build_case(users, slots_per_day, args.unavailable)
+            for name, cls in PLANNERS.items():
+                planner = cls()
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    plan = planner.plan(*case)
+                ms = (time.perf_counter() - start) / args.repeat * 1000
+                s = score(plan, case[0], case[3])
+                print(f"{name:<9}{users:>7}{len(case[1]):>7}{ms:>10.2f}{s['load stdev']:>8.2f}{s['max load']:>5}"
+                      f"{s['same-day doubles']:>9}{s['unavailable']:>9}{s['empty']:>7}")
+
+    print(f"\n{args.weeks} weeks at once")
+    print(f"{'engine':<9}{'users':>7}{'slots':>7}{'batch ms':>10}{'weekly ms':>11}{'min':>5}{'max':>5}{'repeats':>9}")
+    weeks = [f"W{w}" for w in range(args.weeks)]
+    repeated = []
+    for slots_per_day in map(int, args.slots_per_day.split(",")):
+        for users in map(int, args.horizon_sizes.split(",")):
+            random.seed(users * 100 + slots_per_day)
+            usernames, slots, completed, _ = build_case(users, slots_per_day, 0)
+            unavailable = {(u, w, day) for u in usernames for w in weeks for day in DAYS
+                           if random.random() < args.unavailable}
+            for name, cls in PLANNERS.items():
+                batch, separate, low, high, repeats = horizon(cls(), usernames, slots, weeks, completed,
+                                                              unavailable)
+                print(f"{name:<9}{users:>7}{len(slots):>7}{batch:>10.1f}{separate:>11.1f}{low:>5}{high:>5}"
+                      f"{repeats:>9}")
+                if repeats and users > 1:
+                    repeated.append(f"{name} with {users} users and {len(slots)} slots")
+    assert not repeated, f"Consecutive weeks planned the same: {', '.join(repeated)}"
+
+
+if __name__ == "__main__":
+    main()
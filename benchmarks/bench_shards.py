@@ -0,0 +1,120 @@
+"""Throughput of the sharded mode (one receiver, N worker processes).
+
+--chats chats with --users members each are created up front. Then
+--updates commands (--command, spread round-robin over the chats) are
+routed through a WorkerPool of 1, 2, 4, ... --max-workers workers, with at
+most --window of them unanswered at a time. The workers reply to a fake Bot
+API server in this process. Throughput is updates per second from the first
+update routed to the last reply received, and only grows with workers up to
+the number of free cores. The share of chats that move when a worker is
+added is printed too.
+
+Usage: python benchmarks/bench_shards.py [--chats 64] [--users 30] [--updates 2000] [--max-workers 4]
+                                         [--window 64] [--command "autoschedule 4"]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test as bot
+from bench_webhook import FakeBotApi
+from repository import JsonRepository
+from shards import HashRing, WorkerPool
+
+TOKEN = "123456:bench"
+
+
+def make_update(update_id, chat_id, command):
+    text = f"/{command}"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "group", "title": f"chat {chat_id}"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "U", "username": f"user{chat_id}"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+
+def populate(chats, users):
+    repo = JsonRepository(bot.DATA_DIR, bot.DAYS, bot.DEFAULT_SLOTS)
+    repo.open()
+    for chat_id in chats:
+        for i in range(users):
+            repo.add_user(chat_id, f"user{chat_id}_{i}", i)
+    return repo
+
+
+async def replies(api, count, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while api.message_id < count:
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"Only {api.message_id} of {count} replies arrived")
+        await asyncio.sleep(0.001)
+
+
+async def run(workers, args):
+    chats = [1000 + i for i in range(args.chats)]
+    with tempfile.TemporaryDirectory() as tmp:
+        # Workers inherit the working directory, so their chats and jobs land here
+        os.chdir(tmp)
+        await populate(chats, args.users).close()
+
+        api = FakeBotApi(0)
+        await api.http.start()
+        pool = WorkerPool(bot.worker_process, workers, args=(TOKEN, api.base_url, 0))
+        await pool.start()
+
+        start = time.perf_counter()
+        for i in range(args.updates):
+            await replies(api, i - args.window + 1)
+            chat_id = chats[i % len(chats)]
+            await pool.dispatch(chat_id, make_update(i + 1, chat_id, args.command))
+        await replies(api, args.updates)
+        elapsed = time.perf_counter() - start
+
+        await pool.stop()
+        await api.http.stop()
+        os.chdir(os.path.dirname(tmp))
+    return args.updates / elapsed
+
+
+def moved_share(workers, keys=100_000):
+    old, new = HashRing(workers), HashRing(workers + 1)
+    return sum(old.shard(k) != new.shard(k) for k in range(keys)) / keys
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=64)
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--window", type=int, default=64, help="updates in flight at most")
+    parser.add_argument("--command", default="autoschedule 4")
+    args = parser.parse_args()
+
+    counts = [1]
+    while counts[-1] * 2 <= args.max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != args.max_workers:
+        counts.append(args.max_workers)
+
+    print(f"{os.cpu_count()} cores, {args.chats} chats of {args.users} users, "
+          f"{args.updates} x /{args.command}")
+    print(f"{'workers':>7}{'updates/s':>11}{'speedup':>9}{'moved +1':>10}")
+    baseline = None
+    for workers in counts:
+        throughput = await run(workers, args)
+        baseline = baseline or throughput
+        print(f"{workers:>7}{throughput:>11.1f}{throughput / baseline:>8.2f}x{moved_share(workers):>10.1%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
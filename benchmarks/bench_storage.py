@@ -0,0 +1,138 @@
+"""Compare the JSON and SQLite storage backends on a large synthetic rotation.
+
+"json archived" is the JSON backend after archive_weeks() has moved every
+week before last week out of the snapshot.
+
+Usage: python benchmarks/bench_storage.py [--users 10000] [--weeks 260] [--per-week 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregates import parse_week, previous_week
+from repository import JsonRepository, SqliteRepository, migrate_json_to_sqlite
+from schedule import slot_names
+from test import DAYS, DEFAULT_SLOTS
+
+TIMES = slot_names(DEFAULT_SLOTS)
+
+CHAT = 1
+
+def build_data(users, weeks, per_week):
+    usernames = [f"user{i}" for i in range(users)]
+    data = {
+        "users": [{"username": u, "user_id": i} for i, u in enumerate(usernames)],
+        "assignments": {day: {time: random.choice(usernames) for time in TIMES} for day in DAYS},
+        "unavailable": [],
+        "mode": "auto",
+        "weekly_stats": {}
+    }
+    start = date.today() - timedelta(weeks=weeks)
+    for w in range(weeks):
+        monday = start + timedelta(weeks=w)
+        year, week, _ = monday.isocalendar()
+        data["weekly_stats"][f"{year}-W{week}"] = {
+            "completed": [
+                {"user": random.choice(usernames), "day": random.choice(DAYS),
+                 "time": random.choice(TIMES), "timestamp": monday.isoformat()}
+                for _ in range(per_week)
+            ],
+            "missed": [],
+            "week_start": monday.isoformat(),
+            "week_end": (monday + timedelta(days=6)).isoformat()
+        }
+    return data, f"{year}-W{week}"
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(repo, week, username, repeat):
+    year_ago = week
+    for _ in range(51):
+        year_ago = previous_week(year_ago)
+    record = {"user": username, "day": "Monday", "time": "night", "timestamp": "2024-01-01T00:00:00"}
+    # A shift is only counted once, so every completion goes to a week of its own
+    year, number = parse_week(week)
+    later = (date.fromisocalendar(year, number, 1) + timedelta(weeks=n) for n in range(1, repeat + 1))
+    later_weeks = iter([f"{d.isocalendar()[0]}-W{d.isocalendar()[1]}" for d in later])
+    return {
+        "open": timed(lambda: (repo.open(), repo.users(CHAT)), 1),
+        "who is on Monday night": timed(lambda: repo.get_assignment(CHAT, "Monday", "night"), repeat),
+        "find user": timed(lambda: repo.get_user(CHAT, username), repeat),
+        "user counts this week": timed(lambda: repo.user_week_counts(CHAT, week)[username], repeat),
+        "weekly report": timed(lambda: repo.week_stats(CHAT, week), repeat),
+        "stats over a year": timed(lambda: repo.range_counts(CHAT, year_ago, week), repeat),
+        "record completion": timed(lambda: repo.add_completion(CHAT, next(later_weeks), "", "", record), repeat),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--weeks", type=int, default=5 * 52)
+    parser.add_argument("--per-week", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    data, week = build_data(args.users, args.weeks, args.per_week)
+    username = data["users"][-1]["username"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_dir = os.path.join(tmp, "chats")
+        db_path = os.path.join(tmp, "data.db")
+        os.makedirs(json_dir)
+        with open(os.path.join(json_dir, f"{CHAT}.json"), "w") as f:
+            json.dump(data, f)
+
+        loader = JsonRepository(json_dir, DAYS, DEFAULT_SLOTS)
+        loader.open()
+        target = SqliteRepository(db_path, DAYS, DEFAULT_SLOTS)
+        target.open()
+        migrate_json_to_sqlite(loader, target, CHAT)
+        await target.close()
+        loader.store(CHAT).release()
+
+        archived_dir = os.path.join(tmp, "archived")
+        shutil.copytree(json_dir, archived_dir)
+        archiver = JsonRepository(archived_dir, DAYS, DEFAULT_SLOTS)
+        archiver.open()
+        await archiver.archive_weeks(CHAT, week)
+        await archiver.close()
+
+        json_repo = JsonRepository(json_dir, DAYS, DEFAULT_SLOTS)
+        archived_repo = JsonRepository(archived_dir, DAYS, DEFAULT_SLOTS)
+        sqlite_repo = SqliteRepository(db_path, DAYS, DEFAULT_SLOTS)
+        results = {
+            "json": run(json_repo, week, username, args.repeat),
+            "json archived": run(archived_repo, week, username, args.repeat),
+            "sqlite": run(sqlite_repo, week, username, args.repeat),
+        }
+        sizes = {name: os.path.getsize(os.path.join(d, f"{CHAT}.json"))
+                 for name, d in (("json", json_dir), ("json archived", archived_dir))}
+        json_repo.store(CHAT).release()
+        archived_repo.store(CHAT).release()
+        await sqlite_repo.close()
+
+    print(f"{args.users} users, {args.weeks} weeks, {args.per_week} completions/week (ms per op)")
+    print(f"{'operation':<26}" + "".join(f"{name:>15}" for name in results))
+    for op in results["json"]:
+        print(f"{op:<26}" + "".join(f"{r[op]:>15.3f}" for r in results.values()))
+    print(f"{'snapshot bytes':<26}" + "".join(f"{size:>15}" for size in sizes.values()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+"""Compare end-to-end handler latency for polling and webhook ingestion.
+
+A fake Bot API server on localhost stands in for Telegram: it answers
+getUpdates by long polling, and records when each reply arrives through
+sendMessage. Synthetic Update JSON is injected at --rate per second,
+either queued for getUpdates (polling) or POSTed with the secret token to
+the bot's WebhookServer (webhook). Latency is from injection until the
+handler's reply reaches the fake API. --latency adds a one-way network delay
+to every leg, which is what makes polling wait for the next getUpdates.
+
+Usage: python benchmarks/bench_webhook.py [--updates 500] [--rate 100] [--latency 20] [--command viewshifts]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import test as bot
+from httpserver import HttpServer
+from webhook import WebhookServer
+
+TOKEN = "123456:bench"
+SECRET = "bench-secret"
+
+
+class FakeBotApi:
+    """Just enough of the Bot API for the bot to start, poll and reply."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.http = HttpServer(self._handle, "127.0.0.1", 0)
+        self.pending = []            # updates waiting for getUpdates
+        self.arrived = asyncio.Event()
+        self.injected = {}           # chat_id -> injection time
+        self.replied = {}            # chat_id -> reply arrival time
+        self.done = asyncio.Event()
+        self.expected = 0
+        self.message_id = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.http.port}/bot"
+
+    def push(self, update):
+        self.pending.append(update)
+        self.arrived.set()
+
+    async def _handle(self, method, path, headers, body):
+        await asyncio.sleep(self.latency)  # request travelling to Telegram
+        name = path.rsplit("/", 1)[-1]
+        params = {k: json.loads(v) if v[:1] in "[{" else v for k, v in parse_qsl(body.decode())}
+        if name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif name == "getUpdates":
+            offset = int(params.get("offset", 0))
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            if not self.pending:
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), float(params.get("timeout", 0)))
+                except asyncio.TimeoutError:
+                    pass
+            result, self.pending = self.pending, []
+        elif name == "sendMessage":
+            chat_id = int(params["chat_id"])
+            self.replied.setdefault(chat_id, time.perf_counter())
+            if len(self.replied) >= self.expected:
+                self.done.set()
+            self.message_id += 1
+            result = {"message_id": self.message_id, "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "group"}, "text": params.get("text", "")}
+        else:
+            result = True
+        await asyncio.sleep(self.latency)  # response travelling back
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def make_update(update_id, chat_id, command):
+    text = f"/{command}"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "group", "title": f"chat {chat_id}"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "U", "username": f"user{chat_id}"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+async def run(mode, args):
+    api = FakeBotApi(args.latency / 1000)
+    api.expected = args.updates
+    await api.http.start()
+    app = bot.build_application(TOKEN, base_url=api.base_url)
+    await app.initialize()
+    await app.start()
+    webhook = None
+    if mode == "webhook":
+        webhook = WebhookServer(app, "127.0.0.1", 0, "/telegram", SECRET)
+        await webhook.start(f"http://127.0.0.1/telegram")
+    else:
+        await app.updater.start_polling(poll_interval=0, timeout=10)
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=40)) as client:
+        async def deliver(update):
+            # Telegram pushes the update after one network hop
+            await asyncio.sleep(api.latency)
+            await client.post(f"http://127.0.0.1:{webhook.port}/telegram", json=update,
+                              headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+
+        deliveries = []
+        start = time.perf_counter()
+        for i in range(args.updates):
+            # One update per chat, so each reply is matched to its update
+            chat_id = 1000 + i
+            update = make_update(i + 1, chat_id, args.command)
+            await asyncio.sleep(max(0.0, start + i / args.rate - time.perf_counter()))
+            api.injected[chat_id] = time.perf_counter()
+            if webhook:
+                deliveries.append(asyncio.create_task(deliver(update)))
+            else:
+                api.push(update)
+        await asyncio.wait_for(api.done.wait(), timeout=60)
+        await asyncio.gather(*deliveries)
+
+    if webhook:
+        await webhook.stop()
+    else:
+        await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    await api.http.stop()
+    return sorted((api.replied[c] - t) * 1000 for c, t in api.injected.items())
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=100, help="updates injected per second")
+    parser.add_argument("--latency", type=float, default=20, help="one-way network delay (ms)")
+    parser.add_argument("--command", default="viewshifts")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot.repo = bot.JsonRepository(os.path.join(tmp, "chats"), bot.DAYS, bot.DEFAULT_SLOTS)
+        bot.repo.open()
+        print(f"{'mode':<9}{'updates':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        for mode in ("polling", "webhook"):
+            latencies = await run(mode, args)
+            q = statistics.quantiles(latencies, n=100)
+            print(f"{mode:<9}{len(latencies):>8}{q[49]:>9.1f}{q[94]:>9.1f}{q[98]:>9.1f}{latencies[-1]:>9.1f}")
+        await bot.repo.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,234 @@
+"""Replay Telegram updates from a JSONL file through the real handlers.
+
+Each line is one Update as the Bot API delivers it (a getUpdates result or
+a webhook body). Updates go through Application.process_update() with
+--concurrency updates in flight, against a fake Bot whose HTTP client
+records every outgoing call instead of touching the network. The report
+has throughput and p50/p95/p99 latency per command, so a storage or
+scheduling change can be checked for regressions offline.
+
+Without --input a synthetic dataset is generated: every member of --chats
+chats joins, each chat runs /autoschedule, then --updates commands and
+/setshift menu clicks follow in a random mix. --save writes that dataset
+out as JSONL for later runs.
+
+Usage: python benchmarks/replay.py [--input updates.jsonl] [--chats 50] [--users 10] [--updates 5000]
+                                   [--concurrency 64] [--backend json|sqlite] [--latency 0] [--save out.jsonl]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+import test as bot
+from menu import encode as encode_menu
+
+TOKEN = "123456:replay"
+MIX = {"viewshifts": 20, "take": 15, "done": 15, "stats": 15, "weeklyreport": 10,
+       "notavailable": 5, "setshift": 10, "menu": 10}
+
+
+class FakeRequest(BaseRequest):
+    """Answers Bot API calls locally and counts them per method."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        name = url.rsplit("/", 1)[-1]
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.json_parameters if request_data else {}
+        if name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+        elif name in ("sendMessage", "editMessageText"):
+            self.message_id += 1
+            result = {"message_id": self.message_id, "date": int(time.time()),
+                      "chat": {"id": int(params.get("chat_id", 0)), "type": "group"},
+                      "text": params.get("text", "")}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class Synthetic:
+    """Builds Update dicts for a set of chats and members."""
+
+    def __init__(self, chats, users, seed):
+        self.random = random.Random(seed)
+        self.chats = [-1000 - c for c in range(chats)]
+        # Telegram ids are unique across chats
+        self.members = {chat: [(c * 1000 + j + 1, f"m{c}x{j}") for j in range(users)]
+                        for c, chat in enumerate(self.chats)}
+        self.update_id = 0
+        self.slots = bot.slot_names(bot.DEFAULT_SLOTS)
+
+    def _base(self):
+        self.update_id += 1
+        return {"update_id": self.update_id}
+
+    def message(self, chat, member, text):
+        user_id, username = member
+        update = self._base()
+        command = text.split()[0]
+        update["message"] = {
+            "message_id": self.update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat, "type": "group", "title": f"chat {chat}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": username, "username": username},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        }
+        return update
+
+    def callback(self, chat, member, data):
+        user_id, username = member
+        update = self._base()
+        update["callback_query"] = {
+            "id": str(self.update_id), "chat_instance": str(chat), "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": username, "username": username},
+            "message": {"message_id": self.update_id, "date": int(time.time()),
+                        "chat": {"id": chat, "type": "group", "title": f"chat {chat}"}},
+        }
+        return update
+
+    def updates(self, count):
+        for chat in self.chats:
+            for member in self.members[chat]:
+                yield self.message(chat, member, "/join")
+        for chat in self.chats:
+            yield self.message(chat, self.members[chat][0], "/autoschedule 4")
+        kinds, weights = zip(*MIX.items())
+        for _ in range(count):
+            chat = self.random.choice(self.chats)
+            member = self.random.choice(self.members[chat])
+            kind = self.random.choices(kinds, weights)[0]
+            day, slot = self.random.choice(bot.DAYS), self.random.choice(self.slots)
+            if kind == "take":
+                yield self.message(chat, member, f"/take {day} {slot}")
+            elif kind == "setshift":
+                _, username = self.random.choice(self.members[chat])
+                yield self.message(chat, member, f"/setshift {day} {slot} @{username}")
+            elif kind == "menu":
+                # The three clicks of the interactive /setshift menu
+                _, username = self.random.choice(self.members[chat])
+                d = bot.DAYS.index(day)
+                yield self.message(chat, member, "/setshift")
+                yield self.callback(chat, member, encode_menu("d", d))
+                yield self.callback(chat, member, encode_menu("t", d, slot))
+                yield self.callback(chat, member, encode_menu("u", d, slot, username))
+            else:
+                yield self.message(chat, member, f"/{kind}")
+
+
+def label(update):
+    """The command or callback an update exercises, for grouping latencies."""
+    if update.callback_query:
+        return "callback " + update.callback_query.data.split(":")[0]
+    if update.message and update.message.text:
+        return update.message.text.split()[0].split("@")[0]
+    return "other"
+
+
+def use_repository(repo):
+    """Point the bot module and its indexes at repo."""
+    bot.repo = repo
+    bot.shift_index.slots_of = bot.reminder_index.slots_of = repo.slots
+    for index in (bot.shift_index, bot.load_index, bot.reminder_index, bot.render_cache, bot.menu_keyboards):
+        repo.subscribe(index)
+    repo.open()
+    bot.load_indexes()
+
+
+async def replay(app, updates, concurrency):
+    """{label: [latency ms]} and the wall time for processing every update."""
+    latencies = defaultdict(list)
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async def worker():
+        while not queue.empty():
+            update = queue.get_nowait()
+            start = time.perf_counter()
+            await app.process_update(update)
+            latencies[label(update)].append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return values * 3
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return q[49], q[94], q[98]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="JSONL file of Update payloads; synthetic when omitted")
+    parser.add_argument("--save", help="write the synthetic dataset here")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--users", type=int, default=10, help="members per chat")
+    parser.add_argument("--updates", type=int, default=5000, help="synthetic updates after setup")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--latency", type=float, default=0, help="fake Bot API round trip (ms)")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+    else:
+        payloads = list(Synthetic(args.chats, args.users, args.seed).updates(args.updates))
+        if args.save:
+            with open(args.save, "w") as f:
+                f.writelines(json.dumps(p) + "\n" for p in payloads)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.backend == "sqlite":
+            use_repository(bot.SqliteRepository(os.path.join(tmp, "data.db"), bot.DAYS, bot.DEFAULT_SLOTS))
+        else:
+            use_repository(bot.JsonRepository(os.path.join(tmp, "chats"), bot.DAYS, bot.DEFAULT_SLOTS))
+        request = FakeRequest(args.latency / 1000)
+        app = bot.build_application(TOKEN, request=request)
+        await app.initialize()
+        updates = [Update.de_json(p, app.bot) for p in payloads]
+
+        latencies, elapsed = await replay(app, updates, args.concurrency)
+        await app.shutdown()
+        await bot.repo.close()
+
+    print(f"{len(updates)} updates at concurrency {args.concurrency} ({args.backend}) in {elapsed:.2f}s: "
+          f"{len(updates) / elapsed:.0f} updates/s")
+    print(f"{'command':<18}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, values in sorted(latencies.items()):
+        p50, p95, p99 = percentiles(values)
+        print(f"{name:<18}{len(values):>7}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{max(values):>9.2f}")
+    print("outgoing calls: " + ", ".join(f"{name} {n}" for name, n in request.calls.most_common()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
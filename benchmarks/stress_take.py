@@ -0,0 +1,123 @@
+"""Fire hundreds of simultaneous /take calls for the same slot and check that
+exactly one caller wins in every chat.
+
+The handler is recompiled here with a yield to the other callers after
+every statement of its locked section, so callers would interleave between
+checking the slot is free and taking it were it not for the chat lock.
+With --unlocked the chat locks are replaced by no-ops, and the run is
+expected to fail with several winners per chat.
+
+Usage: python benchmarks/stress_take.py [--chats 20] [--callers 500] [--backend json|sqlite] [--unlocked]
+"""
+import argparse
+import ast
+import asyncio
+import inspect
+import os
+import random
+import sys
+import tempfile
+import textwrap
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test as bot
+
+
+class FakeMessage:
+    def __init__(self, username, user_id):
+        self.from_user = SimpleNamespace(username=username, id=user_id)
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        # Yield like a real network round-trip so handlers interleave
+        await asyncio.sleep(random.random() / 1000)
+        self.replies.append(text)
+
+
+class NoLocks:
+    @asynccontextmanager
+    async def hold(self, chat_id):
+        yield
+
+    def __len__(self):
+        return 0
+
+
+class YieldInLockedSections(ast.NodeTransformer):
+    def visit_AsyncWith(self, node):
+        self.generic_visit(node)
+        if any(isinstance(item.context_expr, ast.Call) and ast.unparse(item.context_expr.func) == "chat_locks.hold"
+               for item in node.items):
+            node.body = [s for stmt in node.body for s in (stmt, ast.parse("await asyncio.sleep(0)").body[0])]
+        return node
+
+
+def interleaving(handler):
+    """handler, recompiled in the bot's module with a yield after every
+    statement of its `async with chat_locks.hold(...)` blocks"""
+    tree = ast.parse(textwrap.dedent(inspect.getsource(handler)))
+    tree = ast.fix_missing_locations(YieldInLockedSections().visit(tree))
+    namespace = {}
+    exec(compile(tree, inspect.getsourcefile(handler), "exec"), vars(bot), namespace)
+    return namespace[handler.__name__]
+
+
+def make_update(chat_id, username, user_id):
+    message = FakeMessage(username, user_id)
+    update = SimpleNamespace(message=message, effective_chat=SimpleNamespace(id=chat_id))
+    return update, message
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--callers", type=int, default=500)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--unlocked", action="store_true", help="run without the chat locks")
+    args = parser.parse_args()
+
+    take = interleaving(bot.take)
+    if args.unlocked:
+        bot.chat_locks = NoLocks()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.backend == "sqlite":
+            bot.repo = bot.SqliteRepository(os.path.join(tmp, "data.db"), bot.DAYS, bot.DEFAULT_SLOTS)
+        else:
+            bot.repo = bot.JsonRepository(os.path.join(tmp, "chats"), bot.DAYS, bot.DEFAULT_SLOTS)
+        bot.repo.open()
+
+        calls = []
+        for chat_id in range(1, args.chats + 1):
+            for i in range(args.callers):
+                update, message = make_update(chat_id, f"user{i}", i)
+                context = SimpleNamespace(args=["monday", "night"])
+                calls.append((chat_id, message, take(update, context)))
+        random.shuffle(calls)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(call for _, _, call in calls))
+        elapsed = time.perf_counter() - start
+
+        failures = 0
+        for chat_id in range(1, args.chats + 1):
+            winners = [m for c, m, _ in calls if c == chat_id and m.replies[0].startswith("✅")]
+            assigned = bot.repo.get_assignment(chat_id, "Monday", "night")
+            if len(winners) != 1 or assigned != winners[0].from_user.username:
+                failures += 1
+                print(f"chat {chat_id}: {len(winners)} winners, slot holds @{assigned}")
+        await bot.repo.close()
+
+    print(f"{len(calls)} /take calls over {args.chats} chats in {elapsed:.3f}s "
+          f"({len(calls) / elapsed:.0f}/s), {len(bot.chat_locks)} locks left")
+    assert failures == 0, f"{failures} chats did not have exactly one winner"
+    assert len(bot.chat_locks) == 0
+    print("OK: exactly one winner per chat")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows rate sends per second with bursts of up to capacity.
+
+    The default capacity of one token paces sends evenly, which keeps any
+    one-second window within the limit.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Take one token and return how many seconds to wait before using it.
+
+        Tokens may go negative, so concurrent callers each get their own
+        slot in the future instead of racing for the same one.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self):
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class Dispatcher:
+    """Queue for outbound messages, drained by a bounded pool of workers.
+
+    Sends are spread to respect Telegram's global and per-chat limits.
+    Flood-control (RetryAfter) pauses every worker for the requested time,
+    network errors are retried with exponential backoff, and messages
+    Telegram rejects outright are dropped.
+    """
+
+    def __init__(self, workers=8, global_rate=30, per_chat_rate=1, max_retries=5, base_backoff=1.0):
+        self.workers = workers
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.bot = None
+        self.queue = asyncio.Queue()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._chat_buckets = {}
+        self._paused_until = 0
+        self._tasks = []
+
+    def start(self, bot):
+        self.bot = bot
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def send(self, chat_id, text, **kwargs):
+        """Queue a message; returns immediately."""
+        self.queue.put_nowait((chat_id, text, kwargs))
+
+    async def drain(self):
+        await self.queue.join()
+
+    async def stop(self, timeout=10):
+        """Give queued messages up to timeout seconds, then stop the workers."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.queue.qsize()} queued messages on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets = {c: b for c, b in self._chat_buckets.items() if not b.idle()}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    async def _wait_for_slot(self, chat_id):
+        await asyncio.sleep(self._chat_bucket(chat_id).reserve())
+        await asyncio.sleep(self.global_bucket.reserve())
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs = await self.queue.get()
+            try:
+                await self._deliver(chat_id, text, kwargs)
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, chat_id, text, kwargs):
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_slot(chat_id)
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                self.sent += 1
+                METRICS.count("chorebot_send_total", outcome="sent")
+                return
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                METRICS.count("chorebot_send_errors_total", reason="flood")
+                logger.warning(f"Flood control: pausing sends for {retry_after}s")
+            except (BadRequest, Forbidden) as e:
+                self.failed += 1
+                METRICS.count("chorebot_send_total", outcome="rejected")
+                logger.error(f"❌ Message to {chat_id} rejected: {e}")
+                return
+            except NetworkError as e:
+                METRICS.count("chorebot_send_errors_total", reason="network")
+                await asyncio.sleep(self.base_backoff * 2 ** attempt * (1 + random.random()))
+                logger.warning(f"Network error sending to {chat_id} ({e}), retrying")
+            except Exception as e:
+                self.failed += 1
+                METRICS.count("chorebot_send_total", outcome="error")
+                logger.error(f"❌ Error sending message to {chat_id}: {e}")
+                return
+            self.retried += 1
+        self.failed += 1
+        METRICS.count("chorebot_send_total", outcome="gave_up")
+        logger.error(f"❌ Giving up on message to {chat_id} after {self.max_retries} retries")
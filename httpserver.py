@@ -0,0 +1,101 @@
+import asyncio
+from http import HTTPStatus
+
+
+class HttpServer:
+    """Minimal HTTP/1.1 server on asyncio streams for small request bodies.
+
+    handler(method, path, headers, body) is awaited per request and returns
+    (status, body bytes); header names are lowercased. Connections are kept
+    alive, so a reverse proxy can reuse them. stop() refuses new connections,
+    closes idle ones and lets requests in flight finish first.
+    """
+
+    def __init__(self, handler, host, port, max_body=1 << 20, content_type="application/json"):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.content_type = content_type
+        self.server = None
+        self.closing = False
+        self.connections = set()  # one task per open connection
+        self.busy = set()         # connections with a request in flight
+
+    async def start(self):
+        self.closing = False
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        # Port 0 picks a free port; report the real one
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self, timeout=10):
+        self.closing = True
+        self.server.close()
+        for task in self.connections - self.busy:
+            task.cancel()
+        if self.busy:
+            await asyncio.wait(list(self.busy), timeout=timeout)
+        for task in self.connections:
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def _read_request(self, reader):
+        """(method, path, version, headers) or None at end of stream."""
+        line = await reader.readline()
+        if not line:
+            return None
+        method, path, version = line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method, path, version, headers
+
+    async def _serve(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while not self.closing:
+                try:
+                    request = await self._read_request(reader)
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                self.busy.add(task)
+                try:
+                    method, path, version, headers = request
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                    if "transfer-encoding" in headers:
+                        status, body, keep_alive = HTTPStatus.LENGTH_REQUIRED, b"", False
+                    elif int(headers.get("content-length", 0)) > self.max_body:
+                        status, body, keep_alive = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, b"", False
+                    else:
+                        payload = await reader.readexactly(int(headers.get("content-length", 0)))
+                        status, body = await self.handler(method, path, headers, payload)
+                    await self._respond(writer, status, body, keep_alive and not self.closing)
+                finally:
+                    self.busy.discard(task)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # closed by stop(); the task ends quietly
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def _respond(self, writer, status, body=b"", keep_alive=True):
+        status = HTTPStatus(status)
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Content-Type: {self.content_type}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
@@ -0,0 +1,111 @@
+import pickle
+import sqlite3
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    next_run_time REAL,
+    job_state BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_next_run_time ON jobs (next_run_time);
+"""
+
+
+class SqliteJobStore(BaseJobStore):
+    """APScheduler job store in a local SQLite file, on the stdlib sqlite3.
+
+    Same layout as APScheduler's SQLAlchemyJobStore (pickled job state,
+    indexed next run time) without needing SQLAlchemy. Jobs, with their
+    next run time, survive restarts, so the scheduler can run the ones
+    that came due while the bot was down according to their misfire grace
+    time and coalescing, instead of starting from the next occurrence.
+    """
+
+    def __init__(self, path, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.path = path
+        self.pickle_protocol = pickle_protocol
+        self.conn = None
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def shutdown(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def lookup_job(self, job_id):
+        row = self.conn.execute("SELECT job_state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs("WHERE next_run_time <= ?", (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        row = self.conn.execute(
+            "SELECT next_run_time FROM jobs WHERE next_run_time IS NOT NULL "
+            "ORDER BY next_run_time LIMIT 1").fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        try:
+            self.conn.execute(
+                "INSERT INTO jobs (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                (job.id, datetime_to_utc_timestamp(job.next_run_time),
+                 pickle.dumps(job.__getstate__(), self.pickle_protocol)))
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id) from None
+
+    def update_job(self, job):
+        cursor = self.conn.execute(
+            "UPDATE jobs SET next_run_time = ?, job_state = ? WHERE id = ?",
+            (datetime_to_utc_timestamp(job.next_run_time),
+             pickle.dumps(job.__getstate__(), self.pickle_protocol), job.id))
+        if cursor.rowcount == 0:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        if self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount == 0:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        self.conn.execute("DELETE FROM jobs")
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where="", params=()):
+        jobs = []
+        failed = []
+        for job_id, job_state in self.conn.execute(
+                f"SELECT id, job_state FROM jobs {where} ORDER BY next_run_time", params).fetchall():
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except BaseException:
+                self._logger.exception(f'Unable to restore job "{job_id}" -- removing it')
+                failed.append(job_id)
+        if failed:
+            self.conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in failed])
+        return jobs
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} (path={self.path})>"
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import os
+
+from aggregates import record_outcome, week_ordinal, week_start_date
+from schedule import Schedule, slot_names
+
+logger = logging.getLogger(__name__)
+
+
+def apply_event(data, event):
+    """Apply one journaled event to the in-memory state."""
+    op = event["op"]
+    if op == "join":
+        data["users"].append({"username": event["username"], "user_id": event["user_id"]})
+    elif op in ("setshift", "take", "notavailable"):
+        data["schedule"].set(event["day"], event["time"], event["user"])
+    elif op == "unavailable":
+        data["unavailable"].append({"user": event["user"], "from": event["from"], "to": event["to"]})
+    elif op == "autoschedule":
+        schedule = data["schedule"]
+        for day, times in event["assignments"].items():
+            for time, username in times.items():
+                schedule.set(day, time, username)
+    elif op == "slots":
+        data["slots"] = event["slots"]
+        data["schedule"].resize(slot_names(event["slots"]))
+        for week in planned_weeks(data):
+            data["weeks"][week].resize(slot_names(event["slots"]))
+    elif op == "plan":
+        for week, schedule in event["weeks"].items():
+            data["weeks"][week] = Schedule.from_json(data["schedule"].days, schedule)
+    elif op == "rollover":
+        # A chat that never rolled over just adopts the week
+        if data["schedule_week"] is not None:
+            data["weeks"][data["schedule_week"]] = data["schedule"]
+            data["schedule"] = data["weeks"].pop(event["week"], None) or data["schedule"].copy()
+        data["schedule_week"] = event["week"]
+    elif op in ("done", "missed"):
+        outcome = "completed" if op == "done" else "missed"
+        weekly_stats = data.setdefault("weekly_stats", {})
+        if event["week"] not in weekly_stats:
+            weekly_stats[event["week"]] = {
+                "completed": [],
+                "missed": [],
+                "week_start": event["week_start"],
+                "week_end": event["week_end"]
+            }
+        weekly_stats[event["week"]][outcome].append(event["record"])
+        record_outcome(data, event["week"], event["record"]["user"], outcome)
+    elif op == "archive":
+        # The weeks were written to the archive before this event was journaled
+        before = week_ordinal(event["before"])
+        for key in ("weekly_stats", "rollups", "weeks"):
+            for week in [w for w in data[key] if week_ordinal(w) < before]:
+                del data[key][week]
+        data["archived_before"] = event["before"]
+        # Unavailability over before that week no longer matters to any schedule
+        start = week_start_date(event["before"])
+        data["unavailable"] = [u for u in data["unavailable"] if isinstance(u, dict) and u["to"] >= start]
+    else:
+        raise ValueError(f"Unknown journal event: {op}")
+
+
+def planned_weeks(data):
+    """Stored weeks after the one the current schedule belongs to."""
+    if data["schedule_week"] is None:
+        return list(data["weeks"])
+    current = week_ordinal(data["schedule_week"])
+    return [week for week in data["weeks"] if week_ordinal(week) > current]
+
+
+class Journal:
+    """Append-only log of state changes, one compact JSON object per line.
+
+    Every event carries a monotonically increasing "seq" so replay can skip
+    whatever a snapshot already contains. Each line reaches the OS at once;
+    with sync_delay set, the fsync to disk follows in a worker thread at most
+    sync_delay seconds later, one per journal however many lines came in
+    meanwhile, instead of blocking the event loop on every append.
+    """
+
+    def __init__(self, path, fsync=True, sync_delay=0):
+        self.path = path
+        self.fsync = fsync
+        self.sync_delay = sync_delay
+        self.size = 0
+        self._f = None
+        self._sync_handle = None
+
+    def replay(self, after_seq=0):
+        """Yield events with seq > after_seq, dropping a torn trailing line."""
+        valid_bytes = 0
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Discarding torn journal entry at byte {valid_bytes}")
+                    break
+                valid_bytes += len(line)
+                if event["seq"] > after_seq:
+                    yield event
+        if valid_bytes != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        self.size = valid_bytes
+
+    def open(self):
+        self._f = open(self.path, 'ab')
+        self.size = self._f.tell()
+
+    def append(self, event):
+        # Opened on the first append, so chats that are only read leave no file
+        if self._f is None:
+            self.open()
+        line = json.dumps(event, separators=(",", ":")).encode() + b"\n"
+        self._f.write(line)
+        self._f.flush()
+        self.size += len(line)
+        if self.fsync:
+            self._sync_soon()
+
+    def _sync_soon(self):
+        if self._sync_handle is not None:
+            return
+        if self.sync_delay:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                self._sync_handle = loop.call_later(self.sync_delay, self._sync_in_background, loop)
+                return
+        os.fsync(self._f.fileno())
+
+    def _sync_in_background(self, loop):
+        self._sync_handle = None
+        # A duplicate descriptor stays valid if the journal is closed or
+        # truncated before the thread gets to it
+        loop.run_in_executor(None, _fsync_and_close, os.dup(self._f.fileno()))
+
+    def truncate_through(self, seq):
+        """Drop every event with seq <= seq, keeping anything appended later."""
+        self.close()
+        keep = list(self.replay(after_seq=seq))
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            for event in keep:
+                f.write(json.dumps(event, separators=(",", ":")).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.open()
+
+    def close(self):
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+            os.fsync(self._f.fileno())
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def _fsync_and_close(fd):
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
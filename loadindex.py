@@ -0,0 +1,105 @@
+import heapq
+from collections import OrderedDict
+
+
+class ChatLoad:
+    """Min-heap of one chat's members keyed on (shifts this week, completions).
+
+    Ties on the current schedule go to whoever has completed the fewest
+    shifts overall, i.e. owes the rotation the most. Entries are replaced
+    lazily: a changed key pushes a new entry and stale ones are skipped
+    when they surface.
+    """
+
+    def __init__(self, usernames, schedule, completed):
+        self.slots = {(day, time): username for day, time, username in schedule.items()}
+        counts = schedule.counts()
+        self.load = {u: counts.get(u, 0) for u in usernames}
+        self.completed = {u: completed.get(u, 0) for u in usernames}
+        self.heap = [self._key(u) for u in self.load]
+        heapq.heapify(self.heap)
+
+    def _key(self, username):
+        return (self.load[username], self.completed[username], username)
+
+    def _push(self, username):
+        heapq.heappush(self.heap, self._key(username))
+        # Rebuild once stale entries dominate so the heap stays O(members)
+        if len(self.heap) > 4 * len(self.load) + 16:
+            self.heap = [self._key(u) for u in self.load]
+            heapq.heapify(self.heap)
+
+    def add_user(self, username):
+        if username not in self.load:
+            self.load[username] = 0
+            self.completed[username] = 0
+            self._push(username)
+
+    def assign(self, day, time, username):
+        previous = self.slots.get((day, time))
+        self.slots[(day, time)] = username
+        for user, delta in ((previous, -1), (username, 1)):
+            if user in self.load:
+                self.load[user] += delta
+                self._push(user)
+
+    def complete(self, username):
+        if username in self.completed:
+            self.completed[username] += 1
+            self._push(username)
+
+    def pick(self, exclude):
+        """Least-loaded member not in exclude, or None."""
+        skipped = []
+        found = None
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            username = entry[2]
+            if username not in self.load or entry != self._key(username):
+                continue  # stale
+            if username in exclude:
+                skipped.append(entry)
+                continue
+            found = entry
+            break
+        for entry in skipped + ([found] if found else []):
+            heapq.heappush(self.heap, entry)
+        return found[2] if found else None
+
+
+class LoadIndex:
+    """Per-chat ChatLoad heaps, built on first use and kept current through
+    repository notifications; at most max_chats are kept."""
+
+    def __init__(self, max_chats=1000):
+        self.max_chats = max_chats
+        self.chats = OrderedDict()
+
+    def for_chat(self, repo, chat_id):
+        chat = self.chats.get(chat_id)
+        if chat is not None:
+            self.chats.move_to_end(chat_id)
+            return chat
+        totals = repo.user_totals(chat_id)
+        chat = ChatLoad([u["username"] for u in repo.users(chat_id)], repo.schedule(chat_id),
+                        {u: t["completed"] for u, t in totals.items()})
+        self.chats[chat_id] = chat
+        if len(self.chats) > self.max_chats:
+            self.chats.popitem(last=False)
+        return chat
+
+    def on_join(self, chat_id, username, user_id):
+        if chat_id in self.chats:
+            self.chats[chat_id].add_user(username)
+
+    def on_assignment(self, chat_id, day, time, username):
+        if chat_id in self.chats:
+            self.chats[chat_id].assign(day, time, username)
+
+    def on_slots(self, chat_id, slots):
+        # Rebuilt from the reshaped schedule on next use
+        self.chats.pop(chat_id, None)
+
+    def on_outcome(self, chat_id, week, outcome, record):
+        if chat_id in self.chats and outcome == "completed":
+            self.chats[chat_id].complete(record["user"])
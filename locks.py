@@ -0,0 +1,32 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class ChatLocks:
+    """One asyncio.Lock per chat, created on demand and dropped once unused.
+
+    Handlers hold the lock only around their read-modify-write of the chat's
+    state, so updates from different chats never wait on each other.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._users = {}
+
+    @asynccontextmanager
+    async def hold(self, chat_id):
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        self._users[chat_id] = self._users.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[chat_id] -= 1
+            if self._users[chat_id] == 0:
+                del self._users[chat_id]
+                del self._locks[chat_id]
+
+    def __len__(self):
+        return len(self._locks)
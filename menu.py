@@ -0,0 +1,125 @@
+"""The interactive /setshift menu.
+
+Every button carries the whole selection so far in its callback_data, so
+a press needs no per-user state, survives restarts and cannot mix up two
+menus open at once:
+
+    d:<day>                    day picked, choose a slot
+    t:<day>:<slot>             slot picked, choose a member (first page)
+    p:<day>:<slot>:<page>      another page of members
+    u:<day>:<slot>:<username>  member picked, assign
+
+<day> is an index into the days. Slot names and Telegram usernames never
+contain ":", and the longest form (20-character slot, 32-character
+username) stays within Telegram's 64-byte limit.
+"""
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+MAX_CALLBACK_DATA = 64
+
+
+def encode(kind, *parts):
+    data = ":".join((kind, *map(str, parts)))
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data {data!r} is longer than {MAX_CALLBACK_DATA} bytes")
+    return data
+
+
+def _is_number(text):
+    return text.isascii() and text.isdecimal()
+
+
+def decode(data):
+    """(kind, day index, slot, last part) of a menu button; missing parts are None.
+
+    The last part is the page number, as an int, for "p" buttons and the
+    username for "u" buttons. Raises ValueError for data this menu did not
+    produce, such as the buttons of menus sent before this encoding.
+    """
+    parts = data.split(":", 3)
+    if (parts[0] not in ("d", "t", "p", "u") or len(parts) != {"d": 2, "t": 3}.get(parts[0], 4)
+            or not _is_number(parts[1]) or (parts[0] == "p" and not _is_number(parts[3]))):
+        raise ValueError(f"Not a menu button: {data!r}")
+    parts += [None] * (4 - len(parts))
+    last = int(parts[3]) if parts[0] == "p" else parts[3]
+    return parts[0], int(parts[1]), parts[2], last
+
+
+class MenuKeyboards:
+    """The menu's keyboards, built once per chat and reused.
+
+    Slot keyboards are dropped when the chat's slots change and member
+    pages when someone joins; keyboards of at most max_chats chats are kept.
+    """
+
+    def __init__(self, days, page_size=10, max_chats=1000):
+        self.days = days
+        self.page_size = page_size
+        self.max_chats = max_chats
+        self.day_keyboard = InlineKeyboardMarkup(
+            [[InlineKeyboardButton(day, callback_data=encode("d", i))] for i, day in enumerate(days)])
+        self.chats = OrderedDict()  # chat_id -> keyboards and the lists they were built from
+
+    def _chat(self, chat_id):
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = {"slots": None, "slot_keyboards": {},
+                                          "members": None, "member_keyboards": {}}
+            if len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+        else:
+            self.chats.move_to_end(chat_id)
+        return chat
+
+    def on_join(self, chat_id, username, user_id):
+        chat = self.chats.get(chat_id)
+        if chat is not None:
+            chat["members"] = None
+            chat["member_keyboards"] = {}
+
+    def on_slots(self, chat_id, slots):
+        self.chats.pop(chat_id, None)
+
+    def members(self, repo, chat_id):
+        chat = self._chat(chat_id)
+        if chat["members"] is None:
+            chat["members"] = [u["username"] for u in repo.users(chat_id)]
+        return chat["members"]
+
+    def slots(self, repo, chat_id):
+        chat = self._chat(chat_id)
+        if chat["slots"] is None:
+            chat["slots"] = [s["name"] for s in repo.slots(chat_id)]
+        return chat["slots"]
+
+    def slot_keyboard(self, repo, chat_id, day):
+        keyboards = self._chat(chat_id)["slot_keyboards"]
+        if day not in keyboards:
+            keyboards[day] = InlineKeyboardMarkup(
+                [[InlineKeyboardButton(slot.capitalize(), callback_data=encode("t", day, slot))]
+                 for slot in self.slots(repo, chat_id)])
+        return keyboards[day]
+
+    def member_keyboard(self, repo, chat_id, day, slot, page=0):
+        """One page of the member picker, with buttons to the pages around it."""
+        members = self.members(repo, chat_id)
+        keyboards = self._chat(chat_id)["member_keyboards"]
+        pages = max(1, -(-len(members) // self.page_size))
+        page = min(max(page, 0), pages - 1)
+        key = (day, slot, page)
+        if key not in keyboards:
+            start = page * self.page_size
+            rows = [[InlineKeyboardButton(f"@{username}", callback_data=encode("u", day, slot, username))]
+                    for username in members[start:start + self.page_size]]
+            nav = []
+            if page > 0:
+                nav.append(InlineKeyboardButton(f"◀️ {page}/{pages}", callback_data=encode("p", day, slot, page - 1)))
+            if page < pages - 1:
+                nav.append(InlineKeyboardButton(f"▶️ {page + 2}/{pages}",
+                                                callback_data=encode("p", day, slot, page + 1)))
+            if nav:
+                rows.append(nav)
+            keyboards[key] = InlineKeyboardMarkup(rows)
+        return keyboards[key]
@@ -0,0 +1,148 @@
+"""In-process metrics, served in the Prometheus text format.
+
+Handlers, storage, jobs and the dispatcher write into the shared METRICS
+registry; server() exposes it on GET /metrics. Counters are always kept.
+Timings are taken for a sample_rate fraction of calls, so they cost next
+to nothing when the rate is lowered; a rate of 0 switches timing off.
+"""
+import random
+import time
+from bisect import bisect_left
+
+from httpserver import HttpServer
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class _Skip:
+    """Stands in for a timer on calls left out of the sample."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_SKIP = _Skip()
+
+
+class Metrics:
+    """Counters and histograms keyed on (name, labels)."""
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.buckets = {}     # name -> bucket bounds, when not LATENCY_BUCKETS
+        self.collectors = []  # callables yielding (name, labels dict, value) gauges at scrape time
+
+    def sampled(self):
+        rate = self.sample_rate
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def count(self, name, value=1, **labels):
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets.get(name, LATENCY_BUCKETS))
+        histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """Context manager recording its duration in seconds, if this call is sampled."""
+        return _Timer(self, name, labels) if self.sampled() else _SKIP
+
+    def add_collector(self, collect):
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for name, series in _by_name(self.counters).items():
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_labels(labels)} {value}" for labels, value in series)
+        for name, series in _by_name(self.histograms).items():
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, n in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        gauges = {}
+        for collect in self.collectors:
+            for name, labels, value in collect():
+                gauges[_key(name, labels)] = value
+        for name, series in _by_name(gauges).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{_labels(labels)} {value}" for labels, value in series)
+        return "\n".join(lines) + "\n"
+
+    def server(self, host, port):
+        """An HttpServer answering GET /metrics; start() it to listen."""
+        async def handle(method, path, headers, body):
+            if path.split("?", 1)[0] != "/metrics":
+                return 404, b""
+            if method != "GET":
+                return 405, b""
+            return 200, self.render().encode()
+        return HttpServer(handle, host, port, content_type=CONTENT_TYPE)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _by_name(series):
+    grouped = {}
+    for (name, labels), value in sorted(series.items(), key=lambda item: item[0]):
+        grouped.setdefault(name, []).append((labels, value))
+    return grouped
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+METRICS = Metrics()
+METRICS.buckets["chorebot_job_lag_seconds"] = LAG_BUCKETS
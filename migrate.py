@@ -0,0 +1,72 @@
+"""One-shot migrations of the JSON rotations.
+
+Usage: python migrate.py [chats-dir] [data.db]
+       python migrate.py --import <chat_id> [data.json] [chats-dir]
+
+The first form copies the per-chat JSON rotations into SQLite. The second
+makes a single-rotation data.json (and its journal) from before per-chat
+state the rotation of chat_id, which is the group's Telegram chat id; for
+the SQLite backend, run the first form afterwards.
+"""
+import asyncio
+import os
+import shutil
+import sys
+
+from repository import JsonRepository, SqliteRepository, migrate_json_to_sqlite
+from test import DAYS, DEFAULT_SLOTS, DATA_DIR, LEGACY_DATA_FILE, SQLITE_FILE, legacy_users
+
+
+def import_data_json(chat_id, path, chats_dir):
+    target = os.path.join(chats_dir, f"{chat_id}.json")
+    if os.path.exists(target) or os.path.exists(target + ".journal"):
+        sys.exit(f"Chat {chat_id} already has a rotation in {chats_dir}, not overwriting it")
+    if not legacy_users(path):
+        sys.exit(f"{path} holds no rotation to import")
+    os.makedirs(chats_dir, exist_ok=True)
+    for suffix in ("", ".journal"):
+        if os.path.exists(path + suffix):
+            shutil.copy2(path + suffix, target + suffix)
+
+    # Old formats are upgraded on load; reading leaves the copy untouched
+    repo = JsonRepository(chats_dir, DAYS, DEFAULT_SLOTS)
+    weekly_stats, _ = repo.history(chat_id)
+    print(f"Imported {len(repo.users(chat_id))} users and {len(weekly_stats)} weeks "
+          f"from {path} as chat {chat_id} in {chats_dir}")
+
+
+async def main():
+    if sys.argv[1:2] == ["--import"]:
+        if len(sys.argv) < 3:
+            sys.exit(__doc__)
+        import_data_json(int(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else LEGACY_DATA_FILE,
+                         sys.argv[4] if len(sys.argv) > 4 else DATA_DIR)
+        return
+
+    json_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    db_path = sys.argv[2] if len(sys.argv) > 2 else SQLITE_FILE
+
+    # Load one chat at a time and never compact, so the source is left untouched
+    source = JsonRepository(json_dir, DAYS, DEFAULT_SLOTS, max_chats=1)
+    target = SqliteRepository(db_path, DAYS, DEFAULT_SLOTS)
+    source.open()
+    target.open()
+
+    users = weeks = completions = 0
+    chats = source.chat_ids()
+    for chat_id in chats:
+        migrate_json_to_sqlite(source, target, chat_id)
+        weekly_stats, _ = source.history(chat_id)
+        users += len(source.users(chat_id))
+        weeks += len(weekly_stats)
+        completions += sum(len(w["completed"]) for w in weekly_stats.values())
+        source.store(chat_id).release()
+
+    print(f"Migrated {len(chats)} chats with {users} users, {weeks} weeks "
+          f"and {completions} completions from {json_dir} to {db_path}")
+
+    await target.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,224 @@
+"""Engines that fill a week of slots with rotation members.
+
+Every planner takes the same inputs and returns {(day, time): username},
+with "" for a slot nobody can take:
+
+    users        usernames in the rotation
+    slots        (day, time) pairs to fill, any number per day
+    completed    {username: all-time completed shifts}, for history debt
+    unavailable  set of (username, day) pairs that must not be assigned
+
+plan_weeks() fills several weeks at once and returns {week: plan}; its
+unavailable set holds (username, week, day) triples instead.
+"""
+import heapq
+import math
+import random
+from collections import Counter
+
+
+def rotation(week, slots, members):
+    """How many places further down the ranking week number week starts
+    than week 0, for slots slots a week.
+
+    Continuing the tiling moves slots places a week. When slots shares a
+    factor with members, that only ever reaches some of the starting places
+    (a single one when members divides slots, so every week would be the
+    same), so each such cycle of weeks starts one place further on.
+    """
+    cycle = members // math.gcd(slots, members)
+    return week * slots + (week // cycle if cycle < members else 0)
+
+
+class ShufflePlanner:
+    """Shuffle members and tile them across the slots in order."""
+
+    def plan(self, users, slots, completed=None, unavailable=frozenset()):
+        user_list = list(users)
+        random.shuffle(user_list)
+        order = (user_list * (len(slots) // len(user_list) + 1))[:len(slots)]
+        return dict(zip(slots, order))
+
+    def plan_weeks(self, users, slots, weeks, completed=None, unavailable=frozenset()):
+        # One shuffle, tiled on across every week instead of reshuffled per week
+        user_list = list(users)
+        random.shuffle(user_list)
+        n = len(user_list)
+        return {week: {slot: user_list[(i + rotation(w, len(slots), n)) % n] for i, slot in enumerate(slots)}
+                for w, week in enumerate(weeks)}
+
+
+class MinCostFlow:
+    """Successive shortest paths with Dijkstra and Johnson potentials."""
+
+    def __init__(self, n):
+        self.n = n
+        self.graph = [[] for _ in range(n)]
+        # Edge i: to[i], cap[i], cost[i]; its reverse is i ^ 1
+        self.to, self.cap, self.cost = [], [], []
+
+    def add_edge(self, u, v, cap, cost):
+        self.graph[u].append(len(self.to))
+        self.to.append(v)
+        self.cap.append(cap)
+        self.cost.append(cost)
+        self.graph[v].append(len(self.to))
+        self.to.append(u)
+        self.cap.append(0)
+        self.cost.append(-cost)
+
+    def solve(self, source, sink, max_flow):
+        """Push up to max_flow units; all initial costs must be >= 0."""
+        potential = [0] * self.n
+        flow = 0
+        while flow < max_flow:
+            dist = [None] * self.n
+            via = [-1] * self.n
+            dist[source] = 0
+            queue = [(0, source)]
+            while queue:
+                d, u = heapq.heappop(queue)
+                if d > dist[u]:
+                    continue
+                for e in self.graph[u]:
+                    if self.cap[e] <= 0:
+                        continue
+                    v = self.to[e]
+                    nd = d + self.cost[e] + potential[u] - potential[v]
+                    if dist[v] is None or nd < dist[v]:
+                        dist[v] = nd
+                        via[v] = e
+                        heapq.heappush(queue, (nd, v))
+            if dist[sink] is None:
+                break
+            for v in range(self.n):
+                if dist[v] is not None:
+                    potential[v] += dist[v]
+            # Every source-sink path ends in a unit-capacity slot edge
+            v = sink
+            while v != source:
+                e = via[v]
+                self.cap[e] -= 1
+                self.cap[e ^ 1] += 1
+                v = self.to[e ^ 1]
+            flow += 1
+        return flow
+
+
+class MinCostPlanner:
+    """Treat the week as a min-cost flow assignment problem.
+
+    The k-th shift given to the same member costs k * load_weight, so load
+    is spread as evenly as possible; a second shift on the same day costs
+    same_day_penalty on top. Members who completed fewer shifts than the
+    rotation average (i.e. owe shifts) are cheaper by debt_weight per shift
+    owed, so with the defaults a member has to owe 50 shifts before history
+    outweighs one extra shift this week. Unavailable (member, day) pairs are
+    never assigned.
+
+    Only the len(slots) + 1 cheapest members per slot can appear in an
+    optimal plan (any other member is matched by an unused cheaper one),
+    so large rotations are pruned before the flow network is built.
+    """
+
+    def __init__(self, load_weight=100, same_day_penalty=1000, debt_weight=2):
+        self.load_weight = load_weight
+        self.same_day_penalty = same_day_penalty
+        self.debt_weight = debt_weight
+
+    def plan(self, users, slots, completed=None, unavailable=frozenset()):
+        users = list(users)
+        completed = completed or {}
+        if not users or not slots:
+            return {slot: "" for slot in slots}
+
+        average = sum(completed.get(u, 0) for u in users) / len(users)
+        debt = {u: max(0.0, average - completed.get(u, 0)) for u in users}
+        max_debt = max(debt.values())
+        # Shifted so every cost is non-negative; each path crosses one slot edge
+        base = {u: round((max_debt - debt[u]) * self.debt_weight) for u in users}
+
+        candidates = {}
+        for slot in slots:
+            day = slot[0]
+            eligible = (u for u in users if (u, day) not in unavailable)
+            candidates[slot] = heapq.nsmallest(len(slots) + 1, eligible, key=base.__getitem__)
+
+        order = {u: i for i, u in enumerate(users)}
+        members = sorted({u for c in candidates.values() for u in c}, key=order.__getitem__)
+        if not members:
+            return {slot: "" for slot in slots}
+        days = list(dict.fromkeys(slot[0] for slot in slots))
+        user_node = {u: 1 + i for i, u in enumerate(members)}
+        day_node = {}
+        for u in members:
+            for day in days:
+                day_node[(u, day)] = 1 + len(members) + len(day_node)
+        slot_node = {slot: 1 + len(members) + len(day_node) + i for i, slot in enumerate(slots)}
+        source, sink = 0, 1 + len(members) + len(day_node) + len(slots)
+
+        flow = MinCostFlow(sink + 1)
+        max_shifts = min(len(slots), -(-len(slots) // len(members)) + len(days))
+        for u in members:
+            for k in range(max_shifts):
+                flow.add_edge(source, user_node[u], 1, k * self.load_weight)
+            for day in days:
+                flow.add_edge(user_node[u], day_node[(u, day)], 1, 0)
+                flow.add_edge(user_node[u], day_node[(u, day)], len(slots), self.same_day_penalty)
+        slot_edges = {}
+        for slot, members_for_slot in candidates.items():
+            for u in members_for_slot:
+                slot_edges[(u, slot)] = len(flow.to)
+                flow.add_edge(day_node[(u, slot[0])], slot_node[slot], 1, base[u])
+            flow.add_edge(slot_node[slot], sink, 1, 0)
+
+        flow.solve(source, sink, len(slots))
+
+        plan = {slot: "" for slot in slots}
+        for (u, slot), e in slot_edges.items():
+            if flow.cap[e] == 0:
+                plan[slot] = u
+        return plan
+
+    def plan_weeks(self, users, slots, weeks, completed=None, unavailable=frozenset()):
+        """Solve the first week, then rotate its plan through the later weeks.
+
+        Members are ranked most-owed first and week w hands each slot to the
+        member rotation(w, ...) places further down that ranking than in the
+        first week, so the rotation continues where the previous week left
+        off without repeating a week. That is one pass over every cell of every week, not a solve
+        per week; only members unavailable on a day are then swapped for
+        the member free that day with the fewest shifts over the horizon.
+        """
+        users = list(users)
+        completed = completed or {}
+        if not users or not weeks:
+            return {week: {slot: "" for slot in slots} for week in weeks}
+        first = self.plan(users, slots, completed, {(u, d) for u, w, d in unavailable if w == weeks[0]})
+
+        order = sorted(users, key=lambda u: completed.get(u, 0))
+        rank = {u: i for i, u in enumerate(order)}
+        template = [rank[first[slot]] if first[slot] else -1 for slot in slots]
+        cells = [order[(r + rotation(w, len(slots), len(order))) % len(order)] if r >= 0 else ""
+                 for w in range(len(weeks)) for r in template]
+
+        plans = {}
+        # Shifts each member has over the whole horizon, kept up to date by the swaps
+        load = Counter(u for u in cells if u)
+        for w, week in enumerate(weeks):
+            plan = dict(zip(slots, cells[w * len(slots):(w + 1) * len(slots)]))
+            for (day, time), username in plan.items():
+                if username and (username, week, day) in unavailable:
+                    busy = {u for (d, _), u in plan.items() if d == day}
+                    free = (u for u in order if (u, week, day) not in unavailable)
+                    # Avoid a second shift that day first, then spread the load
+                    replacement = min(free, default="", key=lambda u: (u in busy, load[u]))
+                    plan[(day, time)] = replacement
+                    load[username] -= 1
+                    if replacement:
+                        load[replacement] += 1
+            plans[week] = plan
+        return plans
+
+
+PLANNERS = {"shuffle": ShufflePlanner, "mincost": MinCostPlanner}
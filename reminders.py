@@ -0,0 +1,60 @@
+from schedule import reminder_time
+
+
+class ReminderIndex:
+    """Assignees per (day, reminder time) across all chats, plus their Telegram ids.
+
+    Slots are configured per chat, so shifts are filed under the time their
+    reminder fires rather than under the slot name. Kept current through
+    repository notifications, so a reminder job only visits the shifts that
+    are actually due instead of every chat.
+    """
+
+    def __init__(self, slots_of):
+        self.slots_of = slots_of  # chat_id -> slot dicts, for chats not seen yet
+        self.fire_at = {}   # chat_id -> {slot: (hour, minute)}
+        self.assigned = {}  # (day, (hour, minute)) -> {(chat_id, slot): username}
+        self.user_ids = {}  # (chat_id, username) -> user_id
+
+    def _fire_times(self, chat_id):
+        times = self.fire_at.get(chat_id)
+        if times is None:
+            times = self.fire_at[chat_id] = {s["name"]: reminder_time(s) for s in self.slots_of(chat_id)}
+        return times
+
+    def load_chat(self, repo, chat_id):
+        for u in repo.users(chat_id):
+            self.user_ids[(chat_id, u["username"])] = u["user_id"]
+        self.fire_at[chat_id] = {s["name"]: reminder_time(s) for s in repo.slots(chat_id)}
+        for day, time, username in repo.schedule(chat_id).items():
+            self.on_assignment(chat_id, day, time, username)
+
+    def fire_times(self):
+        """Every (hour, minute) at which some chat has a reminder."""
+        return {t for times in self.fire_at.values() for t in times.values()}
+
+    def on_join(self, chat_id, username, user_id):
+        self.user_ids[(chat_id, username)] = user_id
+
+    def on_slots(self, chat_id, slots):
+        old = self.fire_at.pop(chat_id, {})
+        for (day, fire_time), chats in self.assigned.items():
+            for time, old_time in old.items():
+                if old_time == fire_time:
+                    chats.pop((chat_id, time), None)
+        self.fire_at[chat_id] = {s["name"]: reminder_time(s) for s in slots}
+
+    def on_assignment(self, chat_id, day, time, username):
+        fire_time = self._fire_times(chat_id).get(time)
+        if fire_time is None:
+            return
+        chats = self.assigned.setdefault((day, fire_time), {})
+        if username:
+            chats[(chat_id, time)] = username
+        else:
+            chats.pop((chat_id, time), None)
+
+    def due(self, day, fire_time):
+        """Yield (chat_id, time, username, user_id) for every shift reminded at fire_time."""
+        for (chat_id, time), username in self.assigned.get((day, fire_time), {}).items():
+            yield chat_id, time, username, self.user_ids.get((chat_id, username))
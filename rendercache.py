@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+from metrics import METRICS
+
+
+class RenderCache:
+    """Rendered reply texts keyed by (chat, view key, state version).
+
+    Each chat has a version for its schedule (assignments, slots, weeks
+    planned ahead) and one for its stats (members, completions, misses),
+    bumped through repository notifications. A cached text is served until
+    the version it was rendered from moves on; at most max_entries texts
+    are kept, least recently used dropped first.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.versions = {}  # (chat_id, "schedule" | "stats") -> version
+        self.entries = OrderedDict()  # (chat_id, key) -> (version, text)
+        self.hits = 0
+        self.misses = 0
+
+    def _bump(self, chat_id, state):
+        self.versions[(chat_id, state)] = self.versions.get((chat_id, state), 0) + 1
+
+    def on_join(self, chat_id, username, user_id):
+        self._bump(chat_id, "stats")
+
+    def on_assignment(self, chat_id, day, time, username):
+        self._bump(chat_id, "schedule")
+
+    def on_slots(self, chat_id, slots):
+        self._bump(chat_id, "schedule")
+
+    def on_weeks(self, chat_id, weeks):
+        self._bump(chat_id, "schedule")
+
+    def on_outcome(self, chat_id, week, outcome, record):
+        self._bump(chat_id, "stats")
+
+    def render(self, chat_id, state, key, build):
+        """The text build() returns for key, re-rendered only once state changed.
+
+        state is the chat state the text is made from, "schedule" or
+        "stats"; key (a tuple starting with the view name) holds
+        everything else it depends on, such as the week shown.
+        """
+        version = self.versions.get((chat_id, state), 0)
+        entry_key = (chat_id, key)
+        entry = self.entries.get(entry_key)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(entry_key)
+            self.hits += 1
+            METRICS.count("chorebot_render_cache_total", view=key[0], result="hit")
+            return entry[1]
+        self.misses += 1
+        METRICS.count("chorebot_render_cache_total", view=key[0], result="miss")
+        text = build()
+        self.entries[entry_key] = (version, text)
+        self.entries.move_to_end(entry_key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return text
@@ -0,0 +1,890 @@
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+
+import aggregates
+from archive import WeekArchive
+from metrics import METRICS
+from schedule import Schedule, slot_names
+from storage import StateStore
+
+
+class Repository:
+    """Storage interface used by the handlers.
+
+    Every method takes the chat id first so backends can partition state;
+    usernames are plain strings and an unassigned shift is "". Each chat
+    has its own list of slots (see schedule.py), starting from
+    default_slots.
+    """
+
+    def __init__(self, days, default_slots):
+        self.days = days
+        self.default_slots = default_slots
+        self.listeners = []
+
+    def subscribe(self, listener):
+        """Register an object to be told about every change.
+
+        Listeners may define on_join(chat_id, username, user_id),
+        on_assignment(chat_id, day, time, username),
+        on_outcome(chat_id, week, outcome, record),
+        on_slots(chat_id, slots) and on_weeks(chat_id, weeks); outcome is
+        "completed" or "missed". on_slots is followed by on_assignment for
+        every cell of the reshaped schedule, and on_weeks lists the week
+        keys stored by save_weeks().
+        """
+        self.listeners.append(listener)
+
+    def _notify(self, event, *args):
+        for listener in self.listeners:
+            handler = getattr(listener, event, None)
+            if handler is not None:
+                handler(*args)
+
+    def _notify_assignments(self, chat_id, schedule):
+        for day, time, username in schedule.items():
+            self._notify("on_assignment", chat_id, day, time, username)
+
+    def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def chat_ids(self):
+        raise NotImplementedError
+
+    def users(self, chat_id):
+        raise NotImplementedError
+
+    def get_user(self, chat_id, username):
+        raise NotImplementedError
+
+    def add_user(self, chat_id, username, user_id):
+        raise NotImplementedError
+
+    def mode(self, chat_id):
+        raise NotImplementedError
+
+    def slots(self, chat_id):
+        """The chat's slot dicts, in display order."""
+        raise NotImplementedError
+
+    def set_slots(self, chat_id, slots):
+        """Replace the chat's slots; assignments to removed slots are dropped."""
+        raise NotImplementedError
+
+    def schedule(self, chat_id):
+        """The chat's Schedule; read-only for callers, change it through the setters."""
+        raise NotImplementedError
+
+    def get_assignment(self, chat_id, day, time):
+        return self.schedule(chat_id).get(day, time)
+
+    def set_assignment(self, chat_id, day, time, username, op="setshift", previous=None):
+        raise NotImplementedError
+
+    def set_schedule(self, chat_id, schedule):
+        """Replace every assignment with those of schedule (same slots)."""
+        raise NotImplementedError
+
+    def roll_over(self, chat_id, week):
+        """Make week the current week if it is later than the schedule's.
+
+        The outgoing schedule is kept under its week key and the schedule
+        planned for week, if any, becomes current; otherwise the outgoing
+        one carries over. Returns whether the current schedule changed.
+        """
+        raise NotImplementedError
+
+    def save_weeks(self, chat_id, schedules):
+        """Store {week: Schedule} for weeks after the current one."""
+        raise NotImplementedError
+
+    async def archive_weeks(self, chat_id, week):
+        """Move weeks before the one preceding week out of the chat's hot state.
+
+        They stay readable through the same methods. Unavailability that
+        ended before them is dropped. Returns how many weeks were moved;
+        backends that never load a chat's whole history move none.
+        """
+        return 0
+
+    def week_schedule(self, chat_id, week):
+        """Stored Schedule of a week other than the current one, or None."""
+        raise NotImplementedError
+
+    def add_unavailability(self, chat_id, username, start, end):
+        """Mark username unavailable from start to end (ISO dates, inclusive)."""
+        raise NotImplementedError
+
+    def unavailable_users(self, chat_id, date):
+        """Usernames marked unavailable on the ISO date."""
+        raise NotImplementedError
+
+    def add_completion(self, chat_id, week, week_start, week_end, record):
+        """Record the shift record["day"], record["time"] of week as completed.
+
+        A shift counts once: returns False, recording nothing, if it already
+        has a completion or miss that week.
+        """
+        raise NotImplementedError
+
+    def add_miss(self, chat_id, week, week_start, week_end, record):
+        """Record the shift as missed, like add_completion()."""
+        raise NotImplementedError
+
+    def week_stats(self, chat_id, week):
+        raise NotImplementedError
+
+    def user_week_counts(self, chat_id, week):
+        """Completed/missed counts per rotation member, from the weekly rollup."""
+        raise NotImplementedError
+
+    def range_counts(self, chat_id, from_week, to_week):
+        """Per-user counts summed over the weekly rollups in [from_week, to_week]."""
+        raise NotImplementedError
+
+    def user_totals(self, chat_id):
+        """All-time counts and streaks per user."""
+        raise NotImplementedError
+
+
+class JsonRepository(Repository):
+    """One JSON snapshot + journal per chat, loaded lazily.
+
+    At most max_chats chat states are kept in memory; the least recently
+    used one is released when another chat is loaded. Closed weeks are
+    moved to a WeekArchive under <directory>/archive by archive_weeks(), of
+    which archive_cache weeks are kept in memory. Journal appends are
+    fsynced at most sync_delay seconds later (see Journal).
+    """
+
+    def __init__(self, directory, days, default_slots, compact_threshold=256 * 1024, max_chats=1000,
+                 archive_cache=64, sync_delay=0):
+        super().__init__(days, default_slots)
+        self.directory = directory
+        self.compact_threshold = compact_threshold
+        self.sync_delay = sync_delay
+        self.max_chats = max_chats
+        self._stores = OrderedDict()
+        self.archive = WeekArchive(os.path.join(directory, "archive"), archive_cache)
+
+    def normalize(self, data):
+        # Validate and fix data structure if needed
+        if "users" not in data:
+            data["users"] = []
+        if "slots" not in data:
+            data["slots"] = [dict(slot) for slot in self.default_slots]
+        if "schedule" in data:
+            data["schedule"] = Schedule.from_json(
+                self.days, {"slots": slot_names(data["slots"]), **data["schedule"]})
+        else:
+            # States from before slots were configurable kept {day: {time: username}}
+            data["schedule"] = Schedule.from_assignments(
+                self.days, slot_names(data["slots"]), data.pop("assignments", {}))
+        # Week key the current schedule belongs to, and every other stored week
+        data.setdefault("schedule_week", None)
+        data["weeks"] = {week: Schedule.from_json(self.days, schedule)
+                         for week, schedule in data.get("weeks", {}).items()}
+        # Completions live in weekly_stats; the journal is the full audit trail
+        data.pop("completed", None)
+        if "unavailable" not in data:
+            data["unavailable"] = []
+        if "mode" not in data:
+            data["mode"] = "auto"
+        if "weekly_stats" not in data:
+            data["weekly_stats"] = {}
+        # Weeks before this one live in the archive
+        data.setdefault("archived_before", None)
+        if "rollups" not in data or "totals" not in data:
+            aggregates.rebuild(data)
+        return data
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    async def close(self):
+        for store in self._stores.values():
+            await store.close()
+        self._stores.clear()
+
+    def store(self, chat_id):
+        store = self._stores.get(chat_id)
+        if store is not None:
+            self._stores.move_to_end(chat_id)
+            return store
+        path = os.path.join(self.directory, f"{chat_id}.json")
+        store = StateStore(path, self.normalize, compact_threshold=self.compact_threshold,
+                           encode=Schedule.to_json, sync_delay=self.sync_delay)
+        store.load()
+        self._stores[chat_id] = store
+        self._evict()
+        return store
+
+    def _evict(self):
+        while len(self._stores) > self.max_chats:
+            # Oldest first, skipping chats with a compaction still in flight
+            idle = next((c for c, s in self._stores.items() if not s.compacting), None)
+            if idle is None:
+                return
+            self._stores.pop(idle).release()
+
+    def state(self, chat_id):
+        return self.store(chat_id).data
+
+    def chat_ids(self):
+        # A chat that has never been compacted only has a journal so far
+        chats = set()
+        for name in os.listdir(self.directory):
+            if name.endswith(".json") or name.endswith(".json.journal"):
+                chats.add(int(name.split(".", 1)[0]))
+        return sorted(chats)
+
+    def users(self, chat_id):
+        return self.state(chat_id)["users"]
+
+    def get_user(self, chat_id, username):
+        return next((u for u in self.state(chat_id)["users"] if u["username"] == username), None)
+
+    def add_user(self, chat_id, username, user_id):
+        self.store(chat_id).record({"op": "join", "username": username, "user_id": user_id})
+        self._notify("on_join", chat_id, username, user_id)
+
+    def mode(self, chat_id):
+        return self.state(chat_id)["mode"]
+
+    def slots(self, chat_id):
+        return self.state(chat_id)["slots"]
+
+    def set_slots(self, chat_id, slots):
+        self.store(chat_id).record({"op": "slots", "slots": slots})
+        self._notify("on_slots", chat_id, slots)
+        self._notify_assignments(chat_id, self.schedule(chat_id))
+
+    def schedule(self, chat_id):
+        return self.state(chat_id)["schedule"]
+
+    def set_assignment(self, chat_id, day, time, username, op="setshift", previous=None):
+        event = {"op": op, "day": day, "time": time, "user": username}
+        if previous is not None:
+            event["from"] = previous
+        self.store(chat_id).record(event)
+        self._notify("on_assignment", chat_id, day, time, username)
+
+    def set_schedule(self, chat_id, schedule):
+        self.store(chat_id).record({"op": "autoschedule", "assignments": schedule.as_dict()})
+        self._notify_assignments(chat_id, self.schedule(chat_id))
+
+    def roll_over(self, chat_id, week):
+        current = self.state(chat_id)["schedule_week"]
+        if current is not None and aggregates.week_ordinal(week) <= aggregates.week_ordinal(current):
+            return False
+        self.store(chat_id).record({"op": "rollover", "week": week})
+        if current is None:
+            return False
+        self._notify_assignments(chat_id, self.schedule(chat_id))
+        return True
+
+    def save_weeks(self, chat_id, schedules):
+        self.store(chat_id).record({"op": "plan", "weeks": {w: s.to_json() for w, s in schedules.items()}})
+        self._notify("on_weeks", chat_id, list(schedules))
+
+    def week_schedule(self, chat_id, week):
+        schedule = self.state(chat_id)["weeks"].get(week)
+        if schedule is None:
+            entry = self._archived(chat_id, week)
+            if entry is not None and entry["schedule"] is not None:
+                schedule = Schedule.from_json(self.days, entry["schedule"])
+        return schedule
+
+    def _archived(self, chat_id, week):
+        """The archive entry of week, if it is old enough to have been archived."""
+        before = self.state(chat_id)["archived_before"]
+        if before is None or aggregates.week_ordinal(week) >= aggregates.week_ordinal(before):
+            return None
+        return self.archive.load(chat_id, week)
+
+    async def archive_weeks(self, chat_id, week):
+        # Outcomes are only recorded for this week and the last (a sweep
+        # running late), so older weeks are final
+        data = self.state(chat_id)
+        before = aggregates.previous_week(week)
+        if data["archived_before"] is not None and \
+                aggregates.week_ordinal(data["archived_before"]) > aggregates.week_ordinal(before):
+            before = data["archived_before"]
+        low = aggregates.week_ordinal(before)
+        closed = {w for key in ("weekly_stats", "rollups", "weeks") for w in data[key]
+                  if aggregates.week_ordinal(w) < low}
+        start = aggregates.week_start_date(before)
+        over = [u for u in data["unavailable"] if not isinstance(u, dict) or u["to"] < start]
+        if not closed and not over:
+            return 0
+        for w in closed:
+            schedule = data["weeks"].get(w)
+            await self.archive.write(chat_id, w, {
+                "stats": data["weekly_stats"].get(w),
+                "rollup": data["rollups"].get(w),
+                "schedule": schedule.to_json() if schedule is not None else None,
+            })
+        self.store(chat_id).record({"op": "archive", "before": before}, compact=True)
+        return len(closed)
+
+    def history(self, chat_id):
+        """({week: stats}, {week: Schedule}) of every stored week, archived ones included."""
+        data = self.state(chat_id)
+        weekly_stats, weeks = {}, {}
+        for week in self.archive.weeks(chat_id):
+            entry = self.archive.load(chat_id, week)
+            if entry["stats"] is not None:
+                weekly_stats[week] = entry["stats"]
+            if entry["schedule"] is not None:
+                weeks[week] = Schedule.from_json(self.days, entry["schedule"])
+        weekly_stats.update(data["weekly_stats"])
+        weeks.update(data["weeks"])
+        return weekly_stats, weeks
+
+    def add_unavailability(self, chat_id, username, start, end):
+        self.store(chat_id).record({"op": "unavailable", "user": username, "from": start, "to": end})
+
+    def unavailable_users(self, chat_id, date):
+        return {u["user"] for u in self.state(chat_id)["unavailable"]
+                if isinstance(u, dict) and u["from"] <= date <= u["to"]}
+
+    def _record_outcome(self, op, chat_id, week, week_start, week_end, record):
+        if (record["day"], record["time"]) in aggregates.outcome_slots(self.week_stats(chat_id, week)):
+            return False
+        self.store(chat_id).record({
+            "op": op,
+            "week": week,
+            "week_start": week_start,
+            "week_end": week_end,
+            "record": record
+        })
+        self._notify("on_outcome", chat_id, week, "completed" if op == "done" else "missed", record)
+        return True
+
+    def add_completion(self, chat_id, week, week_start, week_end, record):
+        return self._record_outcome("done", chat_id, week, week_start, week_end, record)
+
+    def add_miss(self, chat_id, week, week_start, week_end, record):
+        return self._record_outcome("missed", chat_id, week, week_start, week_end, record)
+
+    def week_stats(self, chat_id, week):
+        week_stats = self.state(chat_id)["weekly_stats"].get(week)
+        if week_stats is None:
+            entry = self._archived(chat_id, week)
+            week_stats = entry and entry["stats"]
+        return week_stats
+
+    def _zero_counts(self, chat_id):
+        return {u["username"]: {"completed": 0, "missed": 0} for u in self.state(chat_id)["users"]}
+
+    def user_week_counts(self, chat_id, week):
+        counts = self._zero_counts(chat_id)
+        rollup = self.state(chat_id)["rollups"].get(week)
+        if rollup is None:
+            entry = self._archived(chat_id, week)
+            rollup = entry and entry["rollup"]
+        if rollup is not None:
+            for user, user_counts in rollup["users"].items():
+                if user in counts:
+                    counts[user] = dict(user_counts)
+        return counts
+
+    def range_counts(self, chat_id, from_week, to_week):
+        counts = self._zero_counts(chat_id)
+        low, high = aggregates.week_ordinal(from_week), aggregates.week_ordinal(to_week)
+        data = self.state(chat_id)
+        rollups = [r for w, r in data["rollups"].items() if low <= aggregates.week_ordinal(w) <= high]
+        if data["archived_before"] is not None and low < aggregates.week_ordinal(data["archived_before"]):
+            for week in self.archive.weeks(chat_id):
+                if low <= aggregates.week_ordinal(week) <= high and week not in data["rollups"]:
+                    rollup = self.archive.load(chat_id, week)["rollup"]
+                    if rollup is not None:
+                        rollups.append(rollup)
+        for rollup in rollups:
+            for user, user_counts in rollup["users"].items():
+                if user in counts:
+                    counts[user]["completed"] += user_counts["completed"]
+                    counts[user]["missed"] += user_counts["missed"]
+        return counts
+
+    def user_totals(self, chat_id):
+        totals = self.state(chat_id)["totals"]
+        return {u["username"]: totals.get(u["username"], aggregates.empty_totals())
+                for u in self.state(chat_id)["users"]}
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    chat_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    joined INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, username)
+);
+CREATE INDEX IF NOT EXISTS users_by_join_order ON users (chat_id, joined);
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    mode TEXT NOT NULL DEFAULT 'auto'
+);
+CREATE TABLE IF NOT EXISTS slots (
+    chat_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    start TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    reminder_offset INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, position)
+);
+CREATE TABLE IF NOT EXISTS schedule_weeks (
+    chat_id INTEGER PRIMARY KEY,
+    week TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS week_schedules (
+    chat_id INTEGER NOT NULL,
+    week TEXT NOT NULL,
+    week_no INTEGER NOT NULL,
+    schedule TEXT NOT NULL,
+    PRIMARY KEY (chat_id, week)
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    chat_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (chat_id, day, slot)
+);
+CREATE INDEX IF NOT EXISTS assignments_by_user ON assignments (chat_id, username);
+CREATE TABLE IF NOT EXISTS unavailability (
+    chat_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS unavailability_by_end ON unavailability (chat_id, end);
+CREATE TABLE IF NOT EXISTS weeks (
+    chat_id INTEGER NOT NULL,
+    week TEXT NOT NULL,
+    week_start TEXT NOT NULL,
+    week_end TEXT NOT NULL,
+    PRIMARY KEY (chat_id, week)
+);
+CREATE TABLE IF NOT EXISTS completions (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    week TEXT NOT NULL,
+    username TEXT NOT NULL,
+    day TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS completions_by_week_user ON completions (chat_id, week, username);
+CREATE TABLE IF NOT EXISTS misses (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    week TEXT NOT NULL,
+    username TEXT NOT NULL,
+    day TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS misses_by_week_user ON misses (chat_id, week, username);
+CREATE TABLE IF NOT EXISTS week_rollups (
+    chat_id INTEGER NOT NULL,
+    week TEXT NOT NULL,
+    week_no INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    missed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, week, username)
+);
+CREATE INDEX IF NOT EXISTS week_rollups_by_week_no ON week_rollups (chat_id, week_no);
+CREATE TABLE IF NOT EXISTS user_totals (
+    chat_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    missed INTEGER NOT NULL DEFAULT 0,
+    streak INTEGER NOT NULL DEFAULT 0,
+    best_streak INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, username)
+);
+"""
+
+# Rollup/total upserts per outcome; UPDATE SET expressions see the old row
+OUTCOME_SQL = {
+    "completed": (
+        "INSERT INTO week_rollups (chat_id, week, week_no, username, completed) VALUES (?, ?, ?, ?, 1) "
+        "ON CONFLICT (chat_id, week, username) DO UPDATE SET completed = completed + 1",
+        "INSERT INTO user_totals (chat_id, username, completed, streak, best_streak) VALUES (?, ?, 1, 1, 1) "
+        "ON CONFLICT (chat_id, username) DO UPDATE SET completed = completed + 1, "
+        "streak = streak + 1, best_streak = MAX(best_streak, streak + 1)",
+    ),
+    "missed": (
+        "INSERT INTO week_rollups (chat_id, week, week_no, username, missed) VALUES (?, ?, ?, ?, 1) "
+        "ON CONFLICT (chat_id, week, username) DO UPDATE SET missed = missed + 1",
+        "INSERT INTO user_totals (chat_id, username, missed) VALUES (?, ?, 1) "
+        "ON CONFLICT (chat_id, username) DO UPDATE SET missed = missed + 1, streak = 0",
+    ),
+}
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose statements are timed as storage reads or writes."""
+
+    def execute(self, sql, parameters=()):
+        op = "read" if sql.startswith("SELECT") else "write"
+        with METRICS.timer("chorebot_storage_seconds", op=op):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        with METRICS.timer("chorebot_storage_seconds", op="write"):
+            return super().executemany(sql, parameters)
+
+
+class SqliteRepository(Repository):
+    """SQLite tables indexed on (chat, week, user) and (chat, day, slot).
+
+    The slots and schedule of the max_chats most recently used chats are
+    kept in memory, so reading who is on a shift never hits the database.
+    """
+
+    def __init__(self, path, days, default_slots, max_chats=1000):
+        super().__init__(days, default_slots)
+        self.path = path
+        self.max_chats = max_chats
+        self.conn = None
+        self._chats = OrderedDict()  # chat_id -> (slots, Schedule)
+
+    def open(self):
+        self.conn = sqlite3.connect(self.path, isolation_level=None, factory=TimedConnection)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Databases created before the rollup tables existed get them backfilled once
+        if self.conn.execute("SELECT 1 FROM week_rollups LIMIT 1").fetchone() is None:
+            for (chat_id,) in self.conn.execute(
+                    "SELECT DISTINCT chat_id FROM completions UNION SELECT DISTINCT chat_id FROM misses").fetchall():
+                self.rebuild_aggregates(chat_id)
+
+    async def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self._chats.clear()
+
+    def chat_ids(self):
+        cursor = self.conn.execute("SELECT DISTINCT chat_id FROM users")
+        cursor.row_factory = None
+        return [r[0] for r in cursor]
+
+    def users(self, chat_id):
+        rows = self.conn.execute(
+            "SELECT username, user_id FROM users WHERE chat_id = ? ORDER BY joined", (chat_id,))
+        return [{"username": r["username"], "user_id": r["user_id"]} for r in rows]
+
+    def _usernames(self, chat_id):
+        cursor = self.conn.execute(
+            "SELECT username FROM users WHERE chat_id = ? ORDER BY joined", (chat_id,))
+        cursor.row_factory = None
+        return [r[0] for r in cursor]
+
+    def get_user(self, chat_id, username):
+        row = self.conn.execute(
+            "SELECT username, user_id FROM users WHERE chat_id = ? AND username = ?",
+            (chat_id, username)).fetchone()
+        return {"username": row["username"], "user_id": row["user_id"]} if row else None
+
+    def add_user(self, chat_id, username, user_id):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO users (chat_id, username, user_id, joined) "
+            "VALUES (?, ?, ?, (SELECT COUNT(*) FROM users WHERE chat_id = ?))",
+            (chat_id, username, user_id, chat_id))
+        self._notify("on_join", chat_id, username, user_id)
+
+    def mode(self, chat_id):
+        row = self.conn.execute("SELECT mode FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row["mode"] if row else "auto"
+
+    def _chat(self, chat_id):
+        cached = self._chats.get(chat_id)
+        if cached is not None:
+            self._chats.move_to_end(chat_id)
+            return cached
+        rows = self.conn.execute(
+            "SELECT name, start, duration, reminder_offset FROM slots WHERE chat_id = ? ORDER BY position",
+            (chat_id,))
+        slots = [dict(r) for r in rows] or [dict(slot) for slot in self.default_slots]
+        schedule = Schedule(self.days, slot_names(slots))
+        rows = self.conn.execute(
+            "SELECT day, slot, username FROM assignments WHERE chat_id = ?", (chat_id,))
+        for r in rows:
+            if schedule.has(r["day"], r["slot"]):
+                schedule.set(r["day"], r["slot"], r["username"])
+        cached = self._chats[chat_id] = (slots, schedule)
+        if len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return cached
+
+    def slots(self, chat_id):
+        return self._chat(chat_id)[0]
+
+    def set_slots(self, chat_id, slots):
+        names = slot_names(slots)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM slots WHERE chat_id = ?", (chat_id,))
+            self.conn.executemany(
+                "INSERT INTO slots (chat_id, position, name, start, duration, reminder_offset) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(chat_id, i, s["name"], s["start"], s["duration"], s["reminder_offset"])
+                 for i, s in enumerate(slots)])
+            self.conn.execute(
+                f"DELETE FROM assignments WHERE chat_id = ? AND slot NOT IN ({', '.join('?' * len(names))})",
+                (chat_id, *names))
+            # Weeks planned ahead take the new slots too; past weeks keep theirs
+            for week, schedule in self._weeks_after(chat_id, self._current_week(chat_id)).items():
+                schedule.resize(names)
+                self._save_week(chat_id, week, schedule)
+        self._chats.pop(chat_id, None)
+        self._notify("on_slots", chat_id, slots)
+        self._notify_assignments(chat_id, self.schedule(chat_id))
+
+    def schedule(self, chat_id):
+        return self._chat(chat_id)[1]
+
+    def set_assignment(self, chat_id, day, time, username, op="setshift", previous=None):
+        schedule = self.schedule(chat_id)
+        self.conn.execute(
+            "INSERT INTO assignments (chat_id, day, slot, username) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (chat_id, day, slot) DO UPDATE SET username = excluded.username",
+            (chat_id, day, time, username))
+        schedule.set(day, time, username)
+        self._notify("on_assignment", chat_id, day, time, username)
+
+    def set_schedule(self, chat_id, schedule):
+        current = self.schedule(chat_id)
+        rows = [(chat_id, day, time, username) for day, time, username in schedule.items()]
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM assignments WHERE chat_id = ?", (chat_id,))
+            self.conn.executemany(
+                "INSERT INTO assignments (chat_id, day, slot, username) VALUES (?, ?, ?, ?)", rows)
+        for _, day, time, username in rows:
+            current.set(day, time, username)
+        self._notify_assignments(chat_id, current)
+
+    def _current_week(self, chat_id):
+        row = self.conn.execute("SELECT week FROM schedule_weeks WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row["week"] if row else None
+
+    def _weeks_after(self, chat_id, week):
+        rows = self.conn.execute(
+            "SELECT week, schedule FROM week_schedules WHERE chat_id = ? AND week_no > ?",
+            (chat_id, aggregates.week_ordinal(week) if week else 0))
+        return {r["week"]: Schedule.from_json(self.days, json.loads(r["schedule"])) for r in rows}
+
+    def _save_week(self, chat_id, week, schedule):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO week_schedules (chat_id, week, week_no, schedule) VALUES (?, ?, ?, ?)",
+            (chat_id, week, aggregates.week_ordinal(week), json.dumps(schedule.to_json(), separators=(",", ":"))))
+
+    def roll_over(self, chat_id, week):
+        current = self._current_week(chat_id)
+        if current is not None and aggregates.week_ordinal(week) <= aggregates.week_ordinal(current):
+            return False
+        planned = self.week_schedule(chat_id, week) if current is not None else None
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("INSERT OR REPLACE INTO schedule_weeks (chat_id, week) VALUES (?, ?)",
+                              (chat_id, week))
+            if current is not None:
+                self._save_week(chat_id, current, self.schedule(chat_id))
+            if planned is not None:
+                self.conn.execute("DELETE FROM week_schedules WHERE chat_id = ? AND week = ?", (chat_id, week))
+                self.conn.execute("DELETE FROM assignments WHERE chat_id = ?", (chat_id,))
+                self.conn.executemany(
+                    "INSERT INTO assignments (chat_id, day, slot, username) VALUES (?, ?, ?, ?)",
+                    [(chat_id, day, time, username) for day, time, username in planned.items()])
+        if current is None:
+            return False
+        self._chats.pop(chat_id, None)
+        self._notify_assignments(chat_id, self.schedule(chat_id))
+        return True
+
+    def save_weeks(self, chat_id, schedules):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for week, schedule in schedules.items():
+                self._save_week(chat_id, week, schedule)
+        self._notify("on_weeks", chat_id, list(schedules))
+
+    def week_schedule(self, chat_id, week):
+        row = self.conn.execute(
+            "SELECT schedule FROM week_schedules WHERE chat_id = ? AND week = ?", (chat_id, week)).fetchone()
+        return Schedule.from_json(self.days, json.loads(row["schedule"])) if row else None
+
+    def add_unavailability(self, chat_id, username, start, end):
+        self.conn.execute(
+            "INSERT INTO unavailability (chat_id, username, start, end) VALUES (?, ?, ?, ?)",
+            (chat_id, username, start, end))
+
+    async def archive_weeks(self, chat_id, week):
+        # Past weeks stay in their indexed tables; only unavailability that
+        # is over goes
+        self.conn.execute("DELETE FROM unavailability WHERE chat_id = ? AND end < ?",
+                          (chat_id, aggregates.week_start_date(aggregates.previous_week(week))))
+        return 0
+
+    def unavailable_users(self, chat_id, date):
+        rows = self.conn.execute(
+            "SELECT username FROM unavailability WHERE chat_id = ? AND end >= ? AND start <= ?",
+            (chat_id, date, date))
+        return {r["username"] for r in rows}
+
+    def _count_outcome(self, chat_id, week, username, outcome):
+        rollup_sql, totals_sql = OUTCOME_SQL[outcome]
+        self.conn.execute(rollup_sql, (chat_id, week, aggregates.week_ordinal(week), username))
+        self.conn.execute(totals_sql, (chat_id, username))
+
+    def _record_outcome(self, table, outcome, chat_id, week, week_start, week_end, record):
+        shift = (chat_id, week, record["day"], record["time"])
+        with self.conn:
+            self.conn.execute("BEGIN")
+            if self.conn.execute(
+                    "SELECT 1 FROM completions WHERE chat_id = ? AND week = ? AND day = ? AND slot = ? "
+                    "UNION ALL SELECT 1 FROM misses WHERE chat_id = ? AND week = ? AND day = ? AND slot = ?",
+                    shift + shift).fetchone() is not None:
+                return False
+            self.conn.execute(
+                "INSERT OR IGNORE INTO weeks (chat_id, week, week_start, week_end) VALUES (?, ?, ?, ?)",
+                (chat_id, week, week_start, week_end))
+            self.conn.execute(
+                f"INSERT INTO {table} (chat_id, week, username, day, slot, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, week, record["user"], record["day"], record["time"], record["timestamp"]))
+            self._count_outcome(chat_id, week, record["user"], outcome)
+        self._notify("on_outcome", chat_id, week, outcome, record)
+        return True
+
+    def add_completion(self, chat_id, week, week_start, week_end, record):
+        return self._record_outcome("completions", "completed", chat_id, week, week_start, week_end, record)
+
+    def add_miss(self, chat_id, week, week_start, week_end, record):
+        return self._record_outcome("misses", "missed", chat_id, week, week_start, week_end, record)
+
+    def rebuild_aggregates(self, chat_id):
+        """Recompute a chat's rollups and totals from the raw records."""
+        rows = self.conn.execute(
+            "SELECT week, username, timestamp, day, slot, 'completed' FROM completions WHERE chat_id = ? "
+            "UNION ALL SELECT week, username, timestamp, day, slot, 'missed' FROM misses WHERE chat_id = ?",
+            (chat_id, chat_id)).fetchall()
+        rows.sort(key=lambda r: (aggregates.week_ordinal(r[0]), r[2]))
+        # Only the first outcome of a shift counts
+        counted = set()
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM week_rollups WHERE chat_id = ?", (chat_id,))
+            self.conn.execute("DELETE FROM user_totals WHERE chat_id = ?", (chat_id,))
+            for week, username, _, day, slot, outcome in rows:
+                if (week, day, slot) not in counted:
+                    counted.add((week, day, slot))
+                    self._count_outcome(chat_id, week, username, outcome)
+
+    def _records(self, table, chat_id, week):
+        rows = self.conn.execute(
+            f"SELECT username, day, slot, timestamp FROM {table} "
+            "WHERE chat_id = ? AND week = ? ORDER BY id", (chat_id, week))
+        return [{"user": r["username"], "day": r["day"], "time": r["slot"], "timestamp": r["timestamp"]}
+                for r in rows]
+
+    def week_stats(self, chat_id, week):
+        row = self.conn.execute(
+            "SELECT week_start, week_end FROM weeks WHERE chat_id = ? AND week = ?",
+            (chat_id, week)).fetchone()
+        if row is None:
+            return None
+        return {
+            "completed": self._records("completions", chat_id, week),
+            "missed": self._records("misses", chat_id, week),
+            "week_start": row["week_start"],
+            "week_end": row["week_end"]
+        }
+
+    def _fill_counts(self, chat_id, rows):
+        counts = {u: {"completed": 0, "missed": 0} for u in self._usernames(chat_id)}
+        for username, completed, missed in rows:
+            if username in counts:
+                counts[username] = {"completed": completed, "missed": missed}
+        return counts
+
+    def user_week_counts(self, chat_id, week):
+        return self._fill_counts(chat_id, self.conn.execute(
+            "SELECT username, completed, missed FROM week_rollups WHERE chat_id = ? AND week = ?",
+            (chat_id, week)).fetchall())
+
+    def range_counts(self, chat_id, from_week, to_week):
+        return self._fill_counts(chat_id, self.conn.execute(
+            "SELECT username, SUM(completed), SUM(missed) FROM week_rollups "
+            "WHERE chat_id = ? AND week_no BETWEEN ? AND ? GROUP BY username",
+            (chat_id, aggregates.week_ordinal(from_week), aggregates.week_ordinal(to_week))).fetchall())
+
+    def user_totals(self, chat_id):
+        totals = {u: aggregates.empty_totals() for u in self._usernames(chat_id)}
+        rows = self.conn.execute(
+            "SELECT username, completed, missed, streak, best_streak FROM user_totals WHERE chat_id = ?",
+            (chat_id,))
+        for r in rows:
+            if r["username"] in totals:
+                totals[r["username"]] = {"completed": r["completed"], "missed": r["missed"],
+                                         "streak": r["streak"], "best_streak": r["best_streak"]}
+        return totals
+
+
+def migrate_json_to_sqlite(json_repo, sqlite_repo, chat_id):
+    """Copy one chat's JSON rotation (snapshot + journal) into SQLite in one transaction."""
+    data = json_repo.state(chat_id)
+    weekly_stats, weeks = json_repo.history(chat_id)
+    conn = sqlite_repo.conn
+    with conn:
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (chat_id, username, user_id, joined) VALUES (?, ?, ?, ?)",
+            [(chat_id, u["username"], u["user_id"], i) for i, u in enumerate(data["users"])])
+        conn.execute(
+            "INSERT INTO chats (chat_id, mode) VALUES (?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET mode = excluded.mode",
+            (chat_id, data["mode"]))
+        conn.execute("DELETE FROM slots WHERE chat_id = ?", (chat_id,))
+        conn.executemany(
+            "INSERT INTO slots (chat_id, position, name, start, duration, reminder_offset) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(chat_id, i, s["name"], s["start"], s["duration"], s["reminder_offset"])
+             for i, s in enumerate(data["slots"])])
+        conn.executemany(
+            "INSERT OR REPLACE INTO assignments (chat_id, day, slot, username) VALUES (?, ?, ?, ?)",
+            [(chat_id, day, time, username) for day, time, username in data["schedule"].items()])
+        if data["schedule_week"] is not None:
+            conn.execute("INSERT OR REPLACE INTO schedule_weeks (chat_id, week) VALUES (?, ?)",
+                         (chat_id, data["schedule_week"]))
+        for week, schedule in weeks.items():
+            sqlite_repo._save_week(chat_id, week, schedule)
+        conn.executemany(
+            "INSERT INTO unavailability (chat_id, username, start, end) VALUES (?, ?, ?, ?)",
+            [(chat_id, u["user"], u["from"], u["to"]) for u in data["unavailable"] if isinstance(u, dict)])
+        for week, week_stats in weekly_stats.items():
+            conn.execute(
+                "INSERT OR IGNORE INTO weeks (chat_id, week, week_start, week_end) VALUES (?, ?, ?, ?)",
+                (chat_id, week, week_stats["week_start"], week_stats["week_end"]))
+            for table, key in (("completions", "completed"), ("misses", "missed")):
+                conn.executemany(
+                    f"INSERT INTO {table} (chat_id, week, username, day, slot, timestamp) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(chat_id, week, r["user"], r["day"], r["time"], r.get("timestamp", ""))
+                     for r in week_stats[key]])
+    sqlite_repo._chats.pop(chat_id, None)
+    sqlite_repo.rebuild_aggregates(chat_id)
@@ -0,0 +1,169 @@
+"""Per-chat shift slots and the weekly schedule matrix.
+
+A slot is a plain dict so it can live in the JSON state and the journal:
+
+    {"name": "morning", "start": "08:00", "duration": 480, "reminder_offset": 13}
+
+duration and reminder_offset are minutes; the reminder fires reminder_offset
+minutes after start (negative for before) and the shift counts as missed
+once duration minutes have passed. Both must fall on the same day.
+"""
+import re
+from array import array
+from collections import Counter
+
+SLOT_NAME = re.compile(r"^[a-z][a-z0-9-]{0,19}$")
+MAX_SLOTS = 8
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_hhmm(text):
+    """Minutes since midnight for "HH:MM"."""
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})", text)
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f"{text!r} is not a time of day (HH:MM)")
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def as_hour_minute(minutes):
+    return divmod(minutes, 60)
+
+
+def make_slot(name, start, duration, reminder_offset=0):
+    """Validated slot dict; raises ValueError with a user-facing message."""
+    name = name.lower()
+    if not SLOT_NAME.match(name):
+        raise ValueError("Slot names are lowercase letters, digits and dashes, starting with a letter.")
+    begin = parse_hhmm(start)
+    try:
+        duration, reminder_offset = int(duration), int(reminder_offset)
+    except ValueError:
+        raise ValueError("Duration and reminder offset are whole minutes.") from None
+    if duration <= 0 or begin + duration >= MINUTES_PER_DAY:
+        raise ValueError("A shift has to end before midnight on the day it starts.")
+    if not 0 <= begin + reminder_offset < MINUTES_PER_DAY:
+        raise ValueError("The reminder has to fall on the day of the shift.")
+    return {"name": name, "start": "%02d:%02d" % as_hour_minute(begin),
+            "duration": duration, "reminder_offset": reminder_offset}
+
+
+def reminder_time(slot):
+    """(hour, minute) at which the slot's assignee is reminded."""
+    return as_hour_minute(parse_hhmm(slot["start"]) + slot["reminder_offset"])
+
+
+def end_time(slot):
+    """(hour, minute) at which a shift still not /done counts as missed."""
+    return as_hour_minute(parse_hhmm(slot["start"]) + slot["duration"])
+
+
+def slot_names(slots):
+    return [s["name"] for s in slots]
+
+
+class Schedule:
+    """The weekly schedule as a days x slots matrix of indices into names.
+
+    names[0] is "" (unassigned) and every assignee is interned once, so a
+    rotation costs four bytes per cell instead of a dict of strings per
+    day, and whole-schedule questions (who has how many shifts) are a
+    single pass over one array. Day positions are shared by all schedules.
+    """
+
+    __slots__ = ("days", "slots", "names", "cells", "_day_pos")
+    _day_positions = {}  # shared by every schedule over the same days
+
+    def __init__(self, days, slots, names=None, cells=None):
+        self.days = days
+        self.slots = list(slots)
+        key = tuple(days)
+        if key not in Schedule._day_positions:
+            Schedule._day_positions[key] = {day: i for i, day in enumerate(days)}
+        self._day_pos = Schedule._day_positions[key]
+        # Assignees are few (at most one per cell), so a list lookup beats a dict
+        self.names = list(names) if names else [""]
+        size = len(days) * len(self.slots)
+        self.cells = cells if cells is not None else array("I", [0]) * size
+
+    @classmethod
+    def from_assignments(cls, days, slots, assignments):
+        """Build from {day: {slot: username}}, ignoring unknown days/slots."""
+        schedule = cls(days, slots)
+        for day, times in assignments.items():
+            for slot, username in times.items():
+                if schedule.has(day, slot):
+                    schedule.set(day, slot, username)
+        return schedule
+
+    @classmethod
+    def from_json(cls, days, data):
+        cells = array("I", (i for row in data["cells"] for i in row))
+        return cls(days, data["slots"], data["names"], cells)
+
+    def to_json(self):
+        # Drop names nobody is assigned to any more
+        used = sorted(set(self.cells) | {0})
+        remap = {old: new for new, old in enumerate(used)}
+        width = len(self.slots)
+        cells = [remap[i] for i in self.cells]
+        return {"slots": self.slots, "names": [self.names[i] for i in used],
+                "cells": [cells[d * width:(d + 1) * width] for d in range(len(self.days))]}
+
+    def has(self, day, slot):
+        return day in self._day_pos and slot in self.slots
+
+    def _cell(self, day, slot):
+        try:
+            return self._day_pos[day] * len(self.slots) + self.slots.index(slot)
+        except ValueError:
+            raise KeyError(slot) from None
+
+    def _intern(self, username):
+        try:
+            return self.names.index(username)
+        except ValueError:
+            self.names.append(username)
+            return len(self.names) - 1
+
+    def get(self, day, slot):
+        return self.names[self.cells[self._cell(day, slot)]]
+
+    def set(self, day, slot, username):
+        self.cells[self._cell(day, slot)] = self._intern(username)
+
+    def row(self, day):
+        """[(slot, username), ...] for one day, in slot order."""
+        start = self._day_pos[day] * len(self.slots)
+        return [(slot, self.names[i]) for slot, i in zip(self.slots, self.cells[start:start + len(self.slots)])]
+
+    def items(self):
+        """Yield (day, slot, username) for every cell, assigned or not."""
+        width = len(self.slots)
+        for d, day in enumerate(self.days):
+            for s, slot in enumerate(self.slots):
+                yield day, slot, self.names[self.cells[d * width + s]]
+
+    def as_dict(self):
+        return {day: dict(self.row(day)) for day in self.days}
+
+    def counts(self):
+        """{username: assigned shifts} over the whole week."""
+        return {self.names[i]: n for i, n in Counter(self.cells).items() if i}
+
+    def blank(self):
+        """An empty schedule of the same shape."""
+        return Schedule(self.days, self.slots)
+
+    def copy(self):
+        return Schedule(self.days, self.slots, self.names, array("I", self.cells))
+
+    def resize(self, slots):
+        """Switch to a new list of slot names, keeping the columns that survive."""
+        slots = list(slots)
+        old_width, width = len(self.slots), len(slots)
+        cells = array("I", [0]) * (len(self.days) * width)
+        for s, slot in enumerate(slots):
+            if slot in self.slots:
+                cells[s::width] = self.cells[self.slots.index(slot)::old_width]
+        self.slots = slots
+        self.cells = cells
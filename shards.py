@@ -0,0 +1,140 @@
+"""Sharded mode: one receiver process feeding a pool of worker processes.
+
+The receiver takes every update from Telegram and hands it to the worker
+owning the update's chat on a consistent hash ring, so a chat is always
+handled by the same single worker, which sees its updates in the order
+they arrived. Each worker runs the full bot (storage, indexes, scheduled
+jobs) for its own shard of the chats and replies to Telegram directly.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import time
+from bisect import bisect_left
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash of chat ids onto shards 0..shards-1.
+
+    Every shard owns points positions on a ring of 64-bit hashes, and a key
+    belongs to the shard at or after its own hash. Going from n to n + 1
+    shards moves about 1/(n + 1) of the keys, all of them to the new shard;
+    going back moves exactly those back.
+    """
+
+    def __init__(self, shards, points=128):
+        ring = sorted((_hash(f"{shard}:{i}"), shard) for shard in range(shards) for i in range(points))
+        self.shards = shards
+        self.hashes = [h for h, _ in ring]
+        self.owners = [shard for _, shard in ring]
+
+    def shard(self, key):
+        i = bisect_left(self.hashes, _hash(str(key)))
+        return self.owners[i % len(self.owners)]
+
+
+class WorkerPool:
+    """The worker processes, one per shard, and the queues feeding them.
+
+    target(index, workers, updates, ready, *args) runs in each worker: it
+    sets ready once it can take updates, then handles every update dict
+    read from the updates queue until it reads None. Workers are spawned,
+    not forked, so they start from a clean interpreter.
+    """
+
+    def __init__(self, target, workers, args=(), start_timeout=120, stop_timeout=120):
+        self.target = target
+        self.args = args
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.ring = HashRing(workers)
+        self.processes = []
+        self.queues = []
+        # Held while routing one update and for a whole resize, so updates
+        # arriving mid-resize wait and go to the chats' new owners
+        self.lock = asyncio.Lock()
+
+    @property
+    def workers(self):
+        return self.ring.shards
+
+    def _spawn(self, index):
+        ready = self.context.Event()
+        process = self.context.Process(
+            target=self.target, name=f"chorebot-worker-{index}", daemon=True,
+            args=(index, self.workers, self.queues[index], ready, *self.args))
+        process.start()
+        return process, ready
+
+    def _started(self, process, ready):
+        deadline = time.monotonic() + self.start_timeout
+        while not ready.wait(0.1):
+            if not process.is_alive() or time.monotonic() > deadline:
+                return False
+        return True
+
+    async def _wait_ready(self, index, process, ready):
+        if not await asyncio.to_thread(self._started, process, ready):
+            process.terminate()
+            raise RuntimeError(f"Worker {index} did not start (exit code {process.exitcode})")
+
+    async def start(self):
+        self.queues = [self.context.Queue() for _ in range(self.workers)]
+        spawned = [self._spawn(i) for i in range(self.workers)]
+        self.processes = [process for process, _ in spawned]
+        await asyncio.gather(*(self._wait_ready(i, process, ready)
+                               for i, (process, ready) in enumerate(spawned)))
+        logger.info(f"Started {self.workers} workers")
+
+    async def stop(self):
+        """Let every worker finish what it was sent, then wait for it to exit."""
+        for queue in self.queues:
+            queue.put(None)
+        for i, process in enumerate(self.processes):
+            await asyncio.to_thread(process.join, self.stop_timeout)
+            if process.is_alive():
+                logger.error(f"Worker {i} did not stop within {self.stop_timeout}s, terminating it")
+                process.terminate()
+        for queue in self.queues:
+            queue.close()
+        self.processes = []
+        self.queues = []
+
+    async def dispatch(self, key, update):
+        """Queue update (a dict) for the worker owning key, normally the chat id."""
+        async with self.lock:
+            index = self.ring.shard(key)
+            process = self.processes[index]
+            if not process.is_alive():
+                # Updates already queued for it stay queued for the replacement
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting it")
+                process, ready = self._spawn(index)
+                self.processes[index] = process
+                await self._wait_ready(index, process, ready)
+            self.queues[index].put(update)
+            METRICS.count("chorebot_routed_total", worker=index)
+
+    async def resize(self, workers):
+        """Rebalance the chats over a new number of workers.
+
+        Chats are only ever open in one process, so every worker is drained
+        and stopped before the new set starts with the new ring; updates
+        arriving meanwhile wait in dispatch().
+        """
+        async with self.lock:
+            if workers == self.workers:
+                return
+            logger.info(f"Resharding from {self.workers} to {workers} workers")
+            await self.stop()
+            self.ring = HashRing(workers)
+            await self.start()
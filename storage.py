@@ -0,0 +1,147 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+
+from journal import Journal, apply_event
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(path, text):
+    """Write text (str or bytes) to path via a temp file in the same directory + rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".data-", suffix=".tmp", dir=directory)
+    try:
+        os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, 'wb' if isinstance(text, bytes) else 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class StateStore:
+    """Keeps the bot state resident in memory, backed by snapshot + journal.
+
+    The snapshot is read once at startup and the journal written since that
+    snapshot is replayed on top of it. Every mutation goes through record(),
+    which applies the event in memory and appends one line to the journal.
+    Once the journal grows past compact_threshold bytes it is folded into a
+    new snapshot in the background. sync_delay is passed on to the Journal.
+    """
+
+    def __init__(self, path, normalize, journal_path=None, compact_threshold=1024 * 1024, encode=None,
+                 sync_delay=0):
+        self.path = path
+        self.normalize = normalize
+        # json.dumps default= hook for objects normalize() puts in the state
+        self.encode = encode
+        self.journal = Journal(journal_path or path + ".journal", sync_delay=sync_delay)
+        self.compact_threshold = compact_threshold
+        self.seq = 0
+        self.saved_seq = 0  # seq the snapshot on disk holds
+        self._data = None
+        self._compact_task = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.load()
+        return self._data
+
+    def load(self):
+        with METRICS.timer("chorebot_storage_seconds", op="load"):
+            try:
+                with open(self.path, 'r') as f:
+                    text = f.read()
+                METRICS.count("chorebot_storage_bytes_total", len(text), op="load")
+                self._data = self.normalize(json.loads(text))
+            except FileNotFoundError:
+                self._data = self.normalize({})
+            except json.JSONDecodeError as e:
+                logger.warning(f"Error loading data file {self.path}: {e}. Starting from an empty state.")
+                self._data = self.normalize({})
+            self.seq = self.saved_seq = self._data.get("journal_seq", 0)
+            replayed = 0
+            for event in self.journal.replay(after_seq=self.seq):
+                apply_event(self._data, event)
+                self.seq = event["seq"]
+                replayed += 1
+            if replayed:
+                logger.info(f"Replayed {replayed} journal events on top of {self.path}")
+        METRICS.count("chorebot_storage_bytes_total", self.journal.size, op="replay")
+        return self._data
+
+    def record(self, event, compact=False):
+        """Apply and journal event; compact=True snapshots right away, for
+        events that shrink the state."""
+        data = self.data
+        self.seq += 1
+        event = {"seq": self.seq, **event}
+        apply_event(data, event)
+        size = self.journal.size
+        with METRICS.timer("chorebot_storage_seconds", op="append"):
+            self.journal.append(event)
+        METRICS.count("chorebot_storage_bytes_total", self.journal.size - size, op="append")
+        if compact or self.journal.size >= self.compact_threshold:
+            self._schedule_compaction()
+
+    def _snapshot_text(self):
+        self._data["journal_seq"] = self.seq
+        return json.dumps(self._data, separators=(",", ":"), default=self.encode)
+
+    def _schedule_compaction(self):
+        if self.compacting:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compact()
+            return
+        self._compact_task = loop.create_task(self._compact_in_background())
+
+    async def _compact_in_background(self):
+        # Serialize on the loop so no handler mutates state mid-dump; only the
+        # file write runs in a worker thread.
+        seq = self.seq
+        with METRICS.timer("chorebot_storage_seconds", op="snapshot"):
+            text = self._snapshot_text()
+            await asyncio.to_thread(atomic_write, self.path, text)
+            self.journal.truncate_through(seq)
+            self.saved_seq = seq
+        METRICS.count("chorebot_storage_bytes_total", len(text), op="snapshot")
+        logger.info(f"Compacted journal into snapshot at seq {seq}")
+
+    def compact(self):
+        # Nothing to fold in for chats that were only read
+        if self._data is None or self.seq == self.saved_seq:
+            return
+        with METRICS.timer("chorebot_storage_seconds", op="snapshot"):
+            text = self._snapshot_text()
+            atomic_write(self.path, text)
+            self.journal.truncate_through(self.seq)
+            self.saved_seq = self.seq
+        METRICS.count("chorebot_storage_bytes_total", len(text), op="snapshot")
+
+    @property
+    def compacting(self):
+        return self._compact_task is not None and not self._compact_task.done()
+
+    def release(self):
+        """Drop the in-memory state; the journal keeps every change durable."""
+        self.journal.close()
+        self._data = None
+
+    async def close(self):
+        """Wait for a running compaction, then write a final snapshot."""
+        if self._compact_task is not None:
+            await self._compact_task
+            self._compact_task = None
+        self.compact()
+        self.journal.close()
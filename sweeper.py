@@ -0,0 +1,122 @@
+from schedule import end_time
+
+
+class ShiftIndex:
+    """Open shifts per (day, end time) across all chats.
+
+    Slots are configured per chat, so shifts are filed under the time they
+    close. For every (day, end) it holds the chats' shifts whose assignee
+    has neither completed nor missed them in the week the slot next closes
+    in. The index is kept current through repository notifications, so
+    closing a slot only visits the shifts that are still open.
+    """
+
+    def __init__(self, slots_of):
+        self.slots_of = slots_of  # chat_id -> slot dicts, for chats not seen yet
+        self.due_week = None
+        self.ends = {}          # chat_id -> {slot: (hour, minute)}
+        self.assigned = {}      # (day, end) -> {(chat_id, slot): username}
+        self.pending = {}       # (day, end) -> {(chat_id, slot): username} still open
+        self.closed = {}        # (day, end) -> (chat_id, slot) already done/missed
+        self.pending_week = {}  # (day, end) -> week key the pending shifts belong to
+
+    def reset(self, due_week):
+        """Start empty; load_chat() then fills in each chat.
+
+        due_week(day, (hour, minute)) gives the week key in which a shift
+        ending then next closes: this week if its window is still open,
+        else next week.
+        """
+        self.due_week = due_week
+        self.ends = {}
+        self.assigned = {}
+        self.pending = {}
+        self.closed = {}
+        self.pending_week = {}
+
+    def _key(self, day, end):
+        key = (day, end)
+        if key not in self.assigned:
+            self.assigned[key] = {}
+            self.pending[key] = {}
+            self.closed[key] = set()
+            self.pending_week[key] = self.due_week(day, end)
+        return key
+
+    def _end_times(self, chat_id):
+        ends = self.ends.get(chat_id)
+        if ends is None:
+            ends = self.ends[chat_id] = {s["name"]: end_time(s) for s in self.slots_of(chat_id)}
+        return ends
+
+    def end_times(self):
+        """Every (hour, minute) at which some chat has a shift closing."""
+        return {t for ends in self.ends.values() for t in ends.values()}
+
+    def load_chat(self, repo, chat_id):
+        ends = self.ends[chat_id] = {s["name"]: end_time(s) for s in repo.slots(chat_id)}
+        outcomes = {}
+        for day, time, username in repo.schedule(chat_id).items():
+            if not username:
+                continue
+            key = self._key(day, ends[time])
+            week = self.pending_week[key]
+            if week not in outcomes:
+                week_stats = repo.week_stats(chat_id, week) or {"completed": [], "missed": []}
+                outcomes[week] = {(r["day"], r["time"]) for r in week_stats["completed"] + week_stats["missed"]}
+            self.assigned[key][(chat_id, time)] = username
+            if (day, time) in outcomes[week]:
+                self.closed[key].add((chat_id, time))
+            else:
+                self.pending[key][(chat_id, time)] = username
+
+    def on_slots(self, chat_id, slots):
+        old = self.ends.get(chat_id, {})
+        new = self.ends[chat_id] = {s["name"]: end_time(s) for s in slots}
+        # Slots that keep their end time keep their open/closed state
+        moved = {time: end for time, end in old.items() if new.get(time) != end}
+        for (day, end), chats in self.assigned.items():
+            for time, old_end in moved.items():
+                if old_end == end:
+                    entry = (chat_id, time)
+                    chats.pop(entry, None)
+                    self.pending[(day, end)].pop(entry, None)
+                    self.closed[(day, end)].discard(entry)
+
+    def on_assignment(self, chat_id, day, time, username):
+        end = self._end_times(chat_id).get(time)
+        if end is None or self.due_week is None:
+            return
+        key, entry = self._key(day, end), (chat_id, time)
+        if username:
+            self.assigned[key][entry] = username
+        else:
+            self.assigned[key].pop(entry, None)
+        if entry in self.closed[key]:
+            return
+        if username:
+            self.pending[key][entry] = username
+        else:
+            self.pending[key].pop(entry, None)
+
+    def on_outcome(self, chat_id, week, outcome, record):
+        end = self._end_times(chat_id).get(record["time"])
+        if end is None or self.due_week is None:
+            return
+        key, entry = self._key(record["day"], end), (chat_id, record["time"])
+        if self.pending_week[key] != week:
+            return
+        self.pending[key].pop(entry, None)
+        self.closed[key].add(entry)
+
+    def close_slot(self, day, end, next_week):
+        """Detach the open shifts ending at (day, end) and re-arm for next_week.
+
+        Returns (week, {(chat_id, slot): username}) for the shifts left open.
+        """
+        key = self._key(day, end)
+        week, still_open = self.pending_week[key], self.pending[key]
+        self.pending[key] = dict(self.assigned[key])
+        self.closed[key] = set()
+        self.pending_week[key] = next_week
+        return week, still_open
@@ -1,16 +1,38 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, Application, CallbackQueryHandler
-import json
-import random
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
 from datetime import datetime, timedelta
 import pytz
 import asyncio
+import functools
+import json
 import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+from repository import JsonRepository, SqliteRepository
+from locks import ChatLocks
+from aggregates import canonical_week, completion_rate, outcome_slots, week_ordinal
+from sweeper import ShiftIndex
+from dispatcher import Dispatcher
+from reminders import ReminderIndex
+from loadindex import LoadIndex
+from planner import PLANNERS
+from schedule import MAX_SLOTS, end_time, make_slot, reminder_time, slot_names
+from webhook import WebhookServer
+from metrics import METRICS
+from jobstore import SqliteJobStore
+from rendercache import RenderCache
+from menu import MenuKeyboards, decode as decode_menu
+from shards import HashRing, WorkerPool
 # hrere
 async def take(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = chat_of(update)
     if len(context.args) != 2:
-        await update.message.reply_text("Usage: /take <day> <morning/night>")
+        await update.message.reply_text(f"Usage: /take <day> <{slot_choices(chat)}>")
         return
 
     day, time = context.args
@@ -18,181 +40,161 @@ async def take(update: Update, context: ContextTypes.DEFAULT_TYPE):
     time = time.lower()
     user = update.message.from_user.username
 
-    if day not in DAYS or time not in TIMES:
-        await update.message.reply_text("Invalid day or time.")
-        return
+    async with chat_locks.hold(chat):
+        valid = repo.schedule(chat).has(day, time)
+        taken = valid and repo.get_assignment(chat, day, time) == ""
+        if taken:
+            repo.set_assignment(chat, day, time, user, op="take")
 
-    data = load_data()
-    if data["assignments"][day][time] == "":
-        data["assignments"][day][time] = user
-        save_data(data)
+    if not valid:
+        await update.message.reply_text("Invalid day or time.")
+    elif taken:
         await update.message.reply_text(f"✅ @{user} has taken over the {time} shift on {day}.")
     else:
         await update.message.reply_text("❌ That shift is already assigned.")    
 
-def get_week_key():
-    """Get current week identifier (year-week)"""
-    now = datetime.now(tz)
-    return f"{now.year}-W{now.isocalendar()[1]}"
-
-def get_week_start_end():
-    """Get start and end dates of current week"""
-    now = datetime.now(tz)
-    start = now - timedelta(days=now.weekday())
-    end = start + timedelta(days=6)
-    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
-
-async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    current_week = get_week_key()
-    
-    # Initialize weekly stats if not exists
-    if "weekly_stats" not in data:
-        data["weekly_stats"] = {}
-    
-    if current_week not in data["weekly_stats"]:
-        data["weekly_stats"][current_week] = {
-            "completed": [],
-            "missed": [],
-            "week_start": get_week_start_end()[0],
-            "week_end": get_week_start_end()[1]
-        }
-    
-    # Calculate completion stats
-    week_stats = data["weekly_stats"][current_week]
-    completed_count = len(week_stats["completed"])
-    missed_count = len(week_stats["missed"])
-    total_shifts = len(data["users"]) * 14  # 2 shifts per day * 7 days
-    
-    message = f"📊 **Statistics for Week {current_week}**\n\n"
-    message += f"✅ Completed: {completed_count}\n"
-    message += f"❌ Missed: {missed_count}\n"
-    message += f"📈 Completion Rate: {(completed_count/(completed_count+missed_count)*100):.1f}%\n\n"
-    
-    # Individual user stats
-    user_stats = {}
-    for u in data["users"]:
-        user_stats[u["username"]] = {"completed": 0, "missed": 0}
-    
-    for completion in week_stats["completed"]:
-        if completion["user"] in user_stats:
-            user_stats[completion["user"]]["completed"] += 1
-    
-    for miss in week_stats["missed"]:
-        if miss["user"] in user_stats:
-            user_stats[miss["user"]]["missed"] += 1
-    
-    message += "👥 **User Performance:**\n"
-    for username, stats in user_stats.items():
-        total = stats["completed"] + stats["missed"]
-        rate = (stats["completed"] / total * 100) if total > 0 else 0
-        message += f"@{username}: {stats['completed']}/{total} ({rate:.1f}%)\n"
-    
-    await update.message.reply_text(message)
-
-async def weeklyreport(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    current_week = get_week_key()
-    
-    if "weekly_stats" not in data or current_week not in data["weekly_stats"]:
-        await update.message.reply_text("No data available for this week.")
-        return
-    
-    week_stats = data["weekly_stats"][current_week]
-    start_date, end_date = get_week_start_end()
-    
-    message = f"📋 **Weekly Report ({start_date} to {end_date})**\n\n"
-    
-    # Completed shifts
-    message += "✅ **Completed Shifts:**\n"
-    for completion in week_stats["completed"]:
-        message += f"• {completion['day']} {completion['time']} - @{completion['user']}\n"
-    
-    message += "\n❌ **Missed Shifts:**\n"
-    for miss in week_stats["missed"]:
-        message += f"• {miss['day']} {miss['time']} - @{miss['user']}\n"
-    
-    await update.message.reply_text(message)
-
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 tz = pytz.timezone("Asia/Kolkata") 
 DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-TIMES = ["morning", "night"]
-DATA_FILE = 'data.json'
-
-# Use AsyncIOScheduler instead of BackgroundScheduler
-scheduler = AsyncIOScheduler(timezone=tz)
-
-def load_data():
-    try:
-        with open(DATA_FILE, 'r') as f:
-            data = json.load(f)
-            # Validate and fix data structure if needed
-            if "users" not in data:
-                data["users"] = []
-            if "assignments" not in data:
-                data["assignments"] = {day: {"morning": "", "night": ""} for day in DAYS}
-            if "completed" not in data:
-                data["completed"] = []
-            if "unavailable" not in data:
-                data["unavailable"] = []
-            if "mode" not in data:
-                data["mode"] = "auto"
-            return data
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logger.warning(f"Error loading data file: {e}. Creating new data file.")
-        # Create default data structure if file doesn't exist or is corrupted
-        default_data = {
-            "users": [],
-            "assignments": {day: {"morning": "", "night": ""} for day in DAYS},
-            "completed": [],
-            "unavailable": [],
-            "mode": "auto"
-        }
-        save_data(default_data)
-        return default_data
-
-def save_data(data):
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+# Slots every chat starts with; /slots changes them per chat. The assignee
+# is reminded reminder_offset minutes after start, and a shift still not
+# /done duration minutes after start counts as missed.
+DEFAULT_SLOTS = [
+    make_slot("morning", "08:00", duration=480, reminder_offset=13),
+    make_slot("night", "16:00", duration=479, reminder_offset=13),
+]
+DATA_DIR = 'chats'
+# Where the single rotation lived before state was kept per chat; it is no
+# longer read, import it with: python migrate.py --import <chat_id>
+LEGACY_DATA_FILE = 'data.json'
+MAX_LOADED_CHATS = 1000  # chat states kept in memory
+ARCHIVE_CACHE_WEEKS = 64  # archived weeks kept in memory (JSON backend)
+CONCURRENT_UPDATES = 256  # updates processed in parallel
+JOURNAL_COMPACT_BYTES = 256 * 1024
+# Journal lines reach the OS right away and survive the bot crashing, but are
+# only fsynced to disk up to this many seconds later, off the event loop and
+# once per chat however many changes came in. A power cut or kernel crash can
+# lose the changes of that last interval; 0 fsyncs every change before the
+# handler goes on, making every chat wait on each other's disk flushes.
+JOURNAL_SYNC_DELAY = 0.1
+STORAGE_BACKEND = "json"  # "json" or "sqlite"
+SQLITE_FILE = 'data.db'
+# Outbound limits, kept under Telegram's ~30 msg/s overall and ~1 msg/s per chat
+SEND_WORKERS = 8
+SEND_GLOBAL_RATE = 25
+SEND_PER_CHAT_RATE = 1
+# "mincost" balances load, avoids same-day doubles and skips unavailable days;
+# "shuffle" is the old random tiling
+AUTOSCHEDULE_PLANNER = "mincost"
+MAX_PLAN_WEEKS = 52  # how far ahead /autoschedule <weeks> may plan
+RENDER_CACHE_ENTRIES = 4096  # rendered replies kept across all chats
+MENU_PAGE_SIZE = 10  # members per page of the /setshift user picker
+# Scheduled jobs persist here, so a restart picks them up where they were
+JOBS_FILE = 'jobs.db'
+# How late a job may still run after downtime; later runs are skipped and
+# logged. Reminders go stale quickly, missed shifts must still be recorded.
+REMINDER_MISFIRE_GRACE = 60 * 60
+SWEEP_MISFIRE_GRACE = 23 * 60 * 60
+# "polling" asks Telegram for updates; "webhook" has Telegram POST them to an
+# embedded HTTP server, normally behind a reverse proxy that terminates TLS
+UPDATE_MODE = "polling"
+WEBHOOK_LISTEN = "127.0.0.1"
+WEBHOOK_PORT = 8080
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_URL = ""  # public https URL the proxy forwards to WEBHOOK_PATH
+WEBHOOK_SECRET = ""  # checked on every request; a fresh one per start when empty
+# Prometheus text metrics on http://METRICS_LISTEN:METRICS_PORT/metrics (port 0
+# disables it). METRICS_SAMPLE_RATE is the fraction of calls that get timed;
+# counters are always kept
+METRICS_LISTEN = "127.0.0.1"
+METRICS_PORT = 9108
+METRICS_SAMPLE_RATE = 1.0
+# With more than one worker, this process only receives updates and routes
+# each chat's to the worker process owning it; every worker runs its shard's
+# handlers and jobs (with jobs in JOBS_FILE plus the worker number) and
+# serves metrics on METRICS_PORT + 1 + its number. SIGUSR1/SIGUSR2 add or
+# remove a worker, rebalancing the chats.
+WORKERS = 1
+
+METRICS.sample_rate = METRICS_SAMPLE_RATE
+
+# Use AsyncIOScheduler instead of BackgroundScheduler; runs missed while
+# the bot was down are coalesced into one
+scheduler = AsyncIOScheduler(timezone=tz, jobstores={"default": SqliteJobStore(JOBS_FILE)},
+                             job_defaults={"coalesce": True, "max_instances": 1})
+
+def make_repository():
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteRepository(SQLITE_FILE, DAYS, DEFAULT_SLOTS, max_chats=MAX_LOADED_CHATS)
+    # One snapshot plus append-only journal per chat in DATA_DIR, compacted
+    # once the journal reaches JOURNAL_COMPACT_BYTES; weeks before last week
+    # are moved to per-week archive files at rollover
+    return JsonRepository(DATA_DIR, DAYS, DEFAULT_SLOTS, compact_threshold=JOURNAL_COMPACT_BYTES,
+                          max_chats=MAX_LOADED_CHATS, archive_cache=ARCHIVE_CACHE_WEEKS,
+                          sync_delay=JOURNAL_SYNC_DELAY)
+
+repo = make_repository()
+# (HashRing, this worker's shard) in a worker process of the sharded mode
+shard = None
+# Serializes read-modify-write per chat so updates can be processed concurrently
+chat_locks = ChatLocks()
+# Rate-limited outbound queue for reminders, started once the bot is up
+dispatcher = Dispatcher(workers=SEND_WORKERS, global_rate=SEND_GLOBAL_RATE, per_chat_rate=SEND_PER_CHAT_RATE)
+# Open shifts per slot, so the missed-shift sweep never rescans all chats
+shift_index = ShiftIndex(repo.slots)
+repo.subscribe(shift_index)
+# Per-chat load heaps for picking a replacement in /notavailable
+load_index = LoadIndex(max_chats=MAX_LOADED_CHATS)
+repo.subscribe(load_index)
+# Assignees per slot, so reminders only visit shifts that are due
+reminder_index = ReminderIndex(repo.slots)
+repo.subscribe(reminder_index)
+planner = PLANNERS[AUTOSCHEDULE_PLANNER]()
+# Keyboards of the /setshift menu, rebuilt only when members or slots change
+menu_keyboards = MenuKeyboards(DAYS, page_size=MENU_PAGE_SIZE, max_chats=MAX_LOADED_CHATS)
+repo.subscribe(menu_keyboards)
+# Reply texts of /viewshifts, /stats and /weeklyreport until the chat changes
+render_cache = RenderCache(max_entries=RENDER_CACHE_ENTRIES)
+repo.subscribe(render_cache)
+
+def chat_of(update: Update):
+    # Each group chat has its own rotation
+    return update.effective_chat.id
+
+def slot_choices(chat):
+    return "/".join(slot_names(repo.slots(chat)))
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("👋 Welcome to the Chore Bot!\nUse /join to be added to the rotation.")
 
 async def join(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
-    data = load_data()
+    chat = chat_of(update)
 
-    if any(u["username"] == user.username for u in data["users"]):
+    if repo.get_user(chat, user.username):
         await update.message.reply_text("You're already in the list.")
         return
 
-    data["users"].append({"username": user.username, "user_id": user.id})
-    save_data(data)
+    repo.add_user(chat, user.username, user.id)
     await update.message.reply_text(f"✅ You have been added to the rotation, @{user.username}.")
 
 # Assign a shift manually with inline keyboard
 async def setshift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(context.args) == 0:
         # Show interactive menu
-        data = load_data()
-        if not data["users"]:
+        if not menu_keyboards.members(repo, chat_of(update)):
             await update.message.reply_text("❌ No users have joined yet.")
             return
-        
-        keyboard = []
-        for day in DAYS:
-            keyboard.append([InlineKeyboardButton(day, callback_data=f"day_{day}")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("📅 Select a day:", reply_markup=reply_markup)
+
+        await update.message.reply_text("📅 Select a day:", reply_markup=menu_keyboards.day_keyboard)
         return
     
+    chat = chat_of(update)
     if len(context.args) != 3:
-        await update.message.reply_text("Usage: /setshift <day> <morning/night> <@username>\nOr use /setshift without arguments for interactive menu.")
+        await update.message.reply_text(f"Usage: /setshift <day> <{slot_choices(chat)}> <@username>\nOr use /setshift without arguments for interactive menu.")
         return
 
     day, time, user = context.args
@@ -200,348 +202,752 @@ async def setshift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     time = time.lower()
     user = user.replace("@", "")
 
-    if day not in DAYS or time not in TIMES:
+    async with chat_locks.hold(chat):
+        valid = repo.schedule(chat).has(day, time)
+        # Fix: Check if user exists in users list properly
+        joined = repo.get_user(chat, user) is not None
+        if valid and joined:
+            repo.set_assignment(chat, day, time, user)
+
+    if not valid:
         await update.message.reply_text("Invalid day or time.")
         return
 
-    data = load_data()
-    # Fix: Check if user exists in users list properly
-    if not any(u["username"] == user for u in data["users"]):
+    if not joined:
         await update.message.reply_text(f"❌ User @{user} has not joined yet.")
         return
 
-    data["assignments"][day][time] = user
-    save_data(data)
     await update.message.reply_text(f"✅ Assigned @{user} to {day} {time} shift.")
 
-# Handle inline keyboard callbacks
+# Handle inline keyboard callbacks; every button carries the selection so far (see menu.py)
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    
-    data = load_data()
-    
-    if query.data.startswith("day_"):
-        day = query.data.split("_")[1]
-        context.user_data["selected_day"] = day
-        
-        keyboard = [
-            [InlineKeyboardButton("Morning", callback_data="time_morning")],
-            [InlineKeyboardButton("Night", callback_data="time_night")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(f"📅 Day: {day}\n🕒 Select time:", reply_markup=reply_markup)
-    
-    elif query.data.startswith("time_"):
-        time = query.data.split("_")[1]
-        context.user_data["selected_time"] = time
-        
-        keyboard = []
-        for user in data["users"]:
-            keyboard.append([InlineKeyboardButton(f"@{user['username']}", callback_data=f"user_{user['username']}")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        day = context.user_data.get("selected_day", "Unknown")
-        await query.edit_message_text(f"📅 Day: {day}\n🕒 Time: {time}\n👤 Select user:", reply_markup=reply_markup)
-    
-    elif query.data.startswith("user_"):
-        username = query.data.split("_")[1]
-        day = context.user_data.get("selected_day")
-        time = context.user_data.get("selected_time")
-        
-        if day and time:
-            data["assignments"][day][time] = username
-            save_data(data)
-            await query.edit_message_text(f"✅ Assigned @{username} to {day} {time} shift.")
+    chat = chat_of(update)
+
+    try:
+        kind, day_index, time, last = decode_menu(query.data)
+        day = DAYS[day_index]
+    except (ValueError, IndexError):
+        # A menu sent before a restart under the old format, or forged data
+        await query.edit_message_text("❌ This menu has expired. Use /setshift again.")
+        return
+
+    if kind == "d":
+        await query.edit_message_text(f"📅 Day: {day}\n🕒 Select time:",
+                                      reply_markup=menu_keyboards.slot_keyboard(repo, chat, day_index))
+
+    elif kind in ("t", "p"):
+        page = last if kind == "p" else 0
+        await query.edit_message_text(f"📅 Day: {day}\n🕒 Time: {time}\n👤 Select user:",
+                                      reply_markup=menu_keyboards.member_keyboard(repo, chat, day_index, time, page))
+
+    else:
+        username = last
+        async with chat_locks.hold(chat):
+            # The slot may have been removed while the menu was open
+            valid = repo.schedule(chat).has(day, time)
+            joined = repo.get_user(chat, username) is not None
+            if valid and joined:
+                repo.set_assignment(chat, day, time, username)
+        if not valid:
+            await query.edit_message_text(f"❌ There is no {time} shift any more.")
+        elif not joined:
+            await query.edit_message_text(f"❌ User @{username} has not joined yet.")
         else:
-            await query.edit_message_text("❌ Error: Missing day or time selection.")
+            await query.edit_message_text(f"✅ Assigned @{username} to {day} {time} shift.")
 
 # View the full schedule
 async def viewshifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    message = "📅 Weekly Shift Schedule:\n\n"
-    for day in DAYS:
-        message += f"{day}:\n"
-        for time in TIMES:
-            person = data["assignments"][day][time]
-            message += f"  {time.capitalize()}: @{person if person else 'Unassigned'}\n"
-        message += "\n"
-    await update.message.reply_text(message)
-
-# Auto assign all 7 days evenly
+    chat = chat_of(update)
+    try:
+        week = canonical_week(context.args[0]) if context.args else get_week_key()
+    except ValueError:
+        await update.message.reply_text("Usage: /viewshifts [<week>], e.g. /viewshifts 2025-W12")
+        return
+
+    current = week == get_week_key()
+
+    def render():
+        if current:
+            schedule = repo.schedule(chat)
+            lines = ["📅 Weekly Shift Schedule:", ""]
+        else:
+            # A week planned ahead with /autoschedule <weeks>, or one gone by
+            schedule = repo.week_schedule(chat, week)
+            if schedule is None:
+                return f"No schedule stored for {week}."
+            lines = [f"📅 Shift Schedule for {week}:", ""]
+        for day in DAYS:
+            lines.append(f"{day}:")
+            for time, person in schedule.row(day):
+                lines.append(f"  {time.capitalize()}: @{person if person else 'Unassigned'}")
+            lines.append("")
+        return "\n".join(lines) + "\n"
+
+    await update.message.reply_text(render_cache.render(chat, "schedule", ("viewshifts", week, current), render))
+
+# Auto assign all 7 days evenly, for this week and optionally the ones after it
 async def autoschedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    users = data["users"]
+    chat = chat_of(update)
+    try:
+        count = int(context.args[0]) if context.args else 1
+    except ValueError:
+        count = 0
+    if len(context.args) > 1 or not 1 <= count <= MAX_PLAN_WEEKS:
+        await update.message.reply_text(f"Usage: /autoschedule [<weeks>], with up to {MAX_PLAN_WEEKS} weeks")
+        return
+    now = datetime.now(tz)
+    week_start = now - timedelta(days=now.weekday())
+    weeks = [get_week_key(now + timedelta(weeks=w)) for w in range(count)]
+    async with chat_locks.hold(chat):
+        users = [u["username"] for u in repo.users(chat)]
+        # A chat nobody has joined is left without any state
+        if users:
+            repo.roll_over(chat, weeks[0])
+            schedule = repo.schedule(chat)
+            unavailable = set()
+            for w, week in enumerate(weeks):
+                for i, day in enumerate(DAYS):
+                    date = (week_start + timedelta(weeks=w, days=i)).strftime("%Y-%m-%d")
+                    unavailable.update((u, week, day) for u in repo.unavailable_users(chat, date))
+            completed = {u: t["completed"] for u, t in repo.user_totals(chat).items()}
+            plans = planner.plan_weeks(users, [(day, time) for day in DAYS for time in schedule.slots],
+                                       weeks, completed, unavailable)
+
+            planned = {}
+            for week, plan in plans.items():
+                planned[week] = schedule.blank()
+                for (day, time), username in plan.items():
+                    planned[week].set(day, time, username)
+
+            repo.set_schedule(chat, planned.pop(weeks[0]))
+            if planned:
+                repo.save_weeks(chat, planned)
+
     if not users:
         await update.message.reply_text("❌ No users have joined yet.")
         return
 
-    # Shuffle users for random fair distribution
-    user_list = [u["username"] for u in users]
-    random.shuffle(user_list)
-    total_shifts = 7 * 2
-    assignment_order = (user_list * ((total_shifts // len(user_list)) + 1))[:total_shifts]
-
-    i = 0
-    for day in DAYS:
-        for time in TIMES:
-            data["assignments"][day][time] = assignment_order[i]
-            i += 1
-
-    save_data(data)
-    await update.message.reply_text("✅ Shifts have been auto-assigned evenly among users.")
+    if len(weeks) > 1:
+        await update.message.reply_text(f"✅ Shifts for {weeks[0]} to {weeks[-1]} have been auto-assigned evenly among users.")
+    else:
+        await update.message.reply_text("✅ Shifts have been auto-assigned evenly among users.")
 
 async def done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user.username
     today = datetime.now(tz).strftime("%A")
-    data = load_data()
+    chat = chat_of(update)
     current_week = get_week_key()
-    
-    # Initialize weekly stats if not exists
-    if "weekly_stats" not in data:
-        data["weekly_stats"] = {}
-    
-    if current_week not in data["weekly_stats"]:
-        data["weekly_stats"][current_week] = {
-            "completed": [],
-            "missed": [],
-            "week_start": get_week_start_end()[0],
-            "week_end": get_week_start_end()[1]
-        }
-
-    for time in TIMES:
-        if data["assignments"][today][time] == user:
-            completion_record = {
-                "user": user,
-                "day": today,
-                "time": time,
-                "timestamp": datetime.now(tz).isoformat()
-            }
-            data["completed"].append(completion_record)
-            data["weekly_stats"][current_week]["completed"].append(completion_record)
-            save_data(data)
-            await update.message.reply_text(f"✅ Thanks @{user}, you've completed the {time} shift today!")
-            return
+    week_start, week_end = get_week_start_end()
+
+    completed_time = None
+    async with chat_locks.hold(chat):
+        shifts = [time for time, assigned in repo.schedule(chat).row(today) if assigned == user]
+        # Shifts already done, or recorded as missed by the sweep, stay closed
+        closed = outcome_slots(repo.week_stats(chat, current_week))
+        for time in shifts:
+            if (today, time) not in closed:
+                completion_record = {
+                    "user": user,
+                    "day": today,
+                    "time": time,
+                    "timestamp": datetime.now(tz).isoformat()
+                }
+                repo.add_completion(chat, current_week, week_start, week_end, completion_record)
+                completed_time = time
+                break
+
+    if completed_time:
+        await update.message.reply_text(f"✅ Thanks @{user}, you've completed the {completed_time} shift today!")
+        return
+
+    if shifts:
+        await update.message.reply_text("❌ Your shifts today are already done or closed; nothing left to mark done.")
+        return
 
     await update.message.reply_text("❌ You are not assigned to any shift today.")
 
 async def notavailable(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user.username
-    today = datetime.now(tz).strftime("%A")
-    data = load_data()
-
-    reassigned = False
-    for time in TIMES:
-        if data["assignments"][today][time] == user:
-            if data["mode"] == "auto":
-                # Find least loaded person
-                user_list = [u["username"] for u in data["users"]]
-                counts = {u: 0 for u in user_list}
-                for d in DAYS:
-                    for t in TIMES:
-                        assigned = data["assignments"][d][t]
-                        if assigned and assigned in counts:
-                            counts[assigned] += 1
-                counts[user] = 999  # exclude self
-                new_user = min(counts, key=counts.get)
-                data["assignments"][today][time] = new_user
-                reassigned = True
-                await update.message.reply_text(f"⚠️ @{user} is unavailable. Shift reassigned to @{new_user}.")
-            else:
-                data["assignments"][today][time] = ""
-                await update.message.reply_text(f"⚠️ @{user} is unavailable. Anyone can take this shift using /take {today} {time}")
-            save_data(data)
-            return
+    now = datetime.now(tz)
+    today = now.strftime("%A")
+    date = now.strftime("%Y-%m-%d")
+    chat = chat_of(update)
+
+    released = []
+    async with chat_locks.hold(chat):
+        repo.add_unavailability(chat, user, date, date)
+        auto = repo.mode(chat) == "auto"
+        for time, assigned in repo.schedule(chat).row(today):
+            if assigned != user:
+                continue
+            new_user = ""
+            if auto:
+                # Least-loaded member who is free today and not already on a shift today
+                exclude = repo.unavailable_users(chat, date) | {user}
+                exclude |= {u for _, u in repo.schedule(chat).row(today)}
+                new_user = load_index.for_chat(repo, chat).pick(exclude) or ""
+            repo.set_assignment(chat, today, time, new_user, op="notavailable", previous=user)
+            released.append((time, new_user))
+
+    if not released:
+        await update.message.reply_text("❌ You don't have a shift today.")
+        return
 
-    await update.message.reply_text("❌ You don't have a shift today.")
+    for time, new_user in released:
+        if new_user:
+            await update.message.reply_text(f"⚠️ @{user} is unavailable. Shift reassigned to @{new_user}.")
+        else:
+            await update.message.reply_text(f"⚠️ @{user} is unavailable. Anyone can take this shift using /take {today} {time}")
 
-def get_week_key():
-    """Get current week identifier (year-week)"""
-    now = datetime.now(tz)
-    return f"{now.year}-W{now.isocalendar()[1]}"
+def get_week_key(now=None):
+    """Get current week identifier (ISO year-week)"""
+    now = now or datetime.now(tz)
+    year, week, _ = now.isocalendar()
+    return f"{year}-W{week}"
 
-def get_week_start_end():
+def get_week_start_end(now=None):
     """Get start and end dates of current week"""
-    now = datetime.now(tz)
+    now = now or datetime.now(tz)
     start = now - timedelta(days=now.weekday())
     end = start + timedelta(days=6)
     return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
 
+def format_rate(completed, missed):
+    rate = completion_rate(completed, missed)
+    return f"{rate:.1f}%" if rate is not None else "N/A"
+
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    current_week = get_week_key()
-    
-    # Initialize weekly stats if not exists
-    if "weekly_stats" not in data:
-        data["weekly_stats"] = {}
-    
-    if current_week not in data["weekly_stats"]:
-        data["weekly_stats"][current_week] = {
-            "completed": [],
-            "missed": [],
-            "week_start": get_week_start_end()[0],
-            "week_end": get_week_start_end()[1]
-        }
-    
-    # Calculate completion stats
-    week_stats = data["weekly_stats"][current_week]
-    completed_count = len(week_stats["completed"])
-    missed_count = len(week_stats["missed"])
-    total_shifts = len(data["users"]) * 14  # 2 shifts per day * 7 days
-    
-    message = f"📊 **Statistics for Week {current_week}**\n\n"
-    message += f"✅ Completed: {completed_count}\n"
-    message += f"❌ Missed: {missed_count}\n"
-    message += f"📈 Completion Rate: {(completed_count/(completed_count+missed_count)*100):.1f}%\n\n"
-    
-    # Individual user stats
-    user_stats = {}
-    for u in data["users"]:
-        user_stats[u["username"]] = {"completed": 0, "missed": 0}
-    
-    for completion in week_stats["completed"]:
-        if completion["user"] in user_stats:
-            user_stats[completion["user"]]["completed"] += 1
-    
-    for miss in week_stats["missed"]:
-        if miss["user"] in user_stats:
-            user_stats[miss["user"]]["missed"] += 1
-    
-    message += "👥 **User Performance:**\n"
-    for username, stats in user_stats.items():
-        total = stats["completed"] + stats["missed"]
-        rate = (stats["completed"] / total * 100) if total > 0 else 0
-        message += f"@{username}: {stats['completed']}/{total} ({rate:.1f}%)\n"
-    
-    await update.message.reply_text(message)
+    chat = chat_of(update)
+    
+    if len(context.args) == 2:
+        try:
+            from_week, to_week = (canonical_week(arg) for arg in context.args)
+            if week_ordinal(from_week) > week_ordinal(to_week):
+                from_week, to_week = to_week, from_week
+        except ValueError:
+            await update.message.reply_text("Usage: /stats [<from-week> <to-week>], e.g. /stats 2025-W1 2025-W12")
+            return
+        key = ("stats", from_week, to_week)
+        title = f"Weeks {from_week} to {to_week}"
+    elif len(context.args) == 0:
+        current_week = get_week_key()
+        key = ("stats", current_week)
+        title = f"Week {current_week}"
+    else:
+        await update.message.reply_text("Usage: /stats [<from-week> <to-week>], e.g. /stats 2025-W1 2025-W12")
+        return
+
+    def render():
+        if len(context.args) == 2:
+            # Summed from the pre-aggregated weekly rollups
+            user_stats = repo.range_counts(chat, from_week, to_week)
+        else:
+            user_stats = repo.user_week_counts(chat, current_week)
+        totals = repo.user_totals(chat)
+        completed_count = sum(s["completed"] for s in user_stats.values())
+        missed_count = sum(s["missed"] for s in user_stats.values())
+
+        lines = [
+            f"📊 **Statistics for {title}**",
+            "",
+            f"✅ Completed: {completed_count}",
+            f"❌ Missed: {missed_count}",
+            f"📈 Completion Rate: {format_rate(completed_count, missed_count)}",
+            "",
+            "👥 **User Performance:**",
+        ]
+        for username, stats in user_stats.items():
+            total = stats["completed"] + stats["missed"]
+            all_time = totals[username]
+            lines.append(
+                f"@{username}: {stats['completed']}/{total} ({format_rate(stats['completed'], stats['missed'])})"
+                f" · all-time {all_time['completed']}/{all_time['completed'] + all_time['missed']}"
+                f" · 🔥 {all_time['streak']} (best {all_time['best_streak']})"
+            )
+        return "\n".join(lines) + "\n"
+
+    await update.message.reply_text(render_cache.render(chat, "stats", key, render))
 
 async def weeklyreport(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
+    chat = chat_of(update)
     current_week = get_week_key()
-    
-    if "weekly_stats" not in data or current_week not in data["weekly_stats"]:
-        await update.message.reply_text("No data available for this week.")
-        return
-    
-    week_stats = data["weekly_stats"][current_week]
-    start_date, end_date = get_week_start_end()
-    
-    message = f"📋 **Weekly Report ({start_date} to {end_date})**\n\n"
-    
-    # Completed shifts
-    message += "✅ **Completed Shifts:**\n"
-    for completion in week_stats["completed"]:
-        message += f"• {completion['day']} {completion['time']} - @{completion['user']}\n"
-    
-    message += "\n❌ **Missed Shifts:**\n"
-    for miss in week_stats["missed"]:
-        message += f"• {miss['day']} {miss['time']} - @{miss['user']}\n"
-    
-    await update.message.reply_text(message)
+
+    def render():
+        week_stats = repo.week_stats(chat, current_week)
+        if week_stats is None:
+            return "No data available for this week."
+
+        start_date, end_date = get_week_start_end()
+        lines = [f"📋 **Weekly Report ({start_date} to {end_date})**", ""]
+
+        # Completed shifts
+        lines.append("✅ **Completed Shifts:**")
+        for completion in week_stats["completed"]:
+            lines.append(f"• {completion['day']} {completion['time']} - @{completion['user']}")
+
+        lines.append("")
+        lines.append("❌ **Missed Shifts:**")
+        for miss in week_stats["missed"]:
+            lines.append(f"• {miss['day']} {miss['time']} - @{miss['user']}")
+        return "\n".join(lines) + "\n"
+
+    await update.message.reply_text(render_cache.render(chat, "stats", ("weeklyreport", current_week), render))
 
 # Fix the notification system
-async def send_reminder_job(application: Application, day: str, time: str):
+async def send_reminder_job(day: str, fire_time: tuple):
+    """Queue the reminders for day that fire at (hour, minute) across all chats"""
+    queued = 0
+    for chat, time, username, user_id in reminder_index.due(day, tuple(fire_time)):
+        try:
+            if user_id is None:
+                # Assigned via /take without having joined
+                user_obj = repo.get_user(chat, username)
+                if not user_obj:
+                    logger.warning(f"User {username} not found in users list of chat {chat}")
+                    continue
+                user_id = user_obj["user_id"]
+            message = f"⏰ Reminder: You are assigned to the {time} shift on {day}. Please reply with /done after completing it."
+            dispatcher.send(user_id, message)
+            queued += 1
+        except Exception as e:
+            logger.error(f"❌ Error sending reminder for chat {chat}: {e}")
+    hour, minute = fire_time
+    logger.info(f"✅ Queued {queued} reminders for {day} {hour}:{minute:02d}")
+
+def shift_end(day: str, end: tuple, now: datetime):
+    """End of the day's shift ending at (hour, minute) in the week containing now"""
+    hour, minute = end
+    monday = now - timedelta(days=now.weekday())
+    end = monday + timedelta(days=DAYS.index(day))
+    return end.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+def last_shift_end(day: str, end: tuple, now: datetime):
+    """Latest end of the day's shift ending at (hour, minute) not after now"""
+    closed = shift_end(day, end, now)
+    return closed if closed <= now else closed - timedelta(days=7)
+
+def job_id(kind: str, day: str, at: tuple):
+    hour, minute = at
+    return f"{kind}-{day[:3].lower()}-{hour:02d}{minute:02d}"
+
+def sweep_pending(day: str, end: tuple, closed: datetime, now: datetime):
+    """Whether the sweep of a shift that closed while the bot was down is still to run"""
+    if not scheduler.running or now - closed > timedelta(seconds=SWEEP_MISFIRE_GRACE):
+        return False
+    job = scheduler.get_job(job_id("sweep", day, end))
+    return job is not None and job.next_run_time is not None and job.next_run_time <= closed
+
+def due_week(day: str, end: tuple, now: datetime = None):
+    """Week key in which the day's shift ending at (hour, minute) next closes"""
+    now = now or datetime.now(tz)
+    closes = shift_end(day, end, now)
+    if closes <= now and not sweep_pending(day, end, closes, now):
+        closes += timedelta(days=7)
+    return get_week_key(closes)
+
+async def sweep_missed_job(day: str, end: tuple):
+    """Record every shift on day ending at (hour, minute) that is still open as missed"""
+    now = datetime.now(tz)
+    # The run may be catching up after downtime, so go by when the shift ended
+    closed = last_shift_end(day, tuple(end), now)
+    next_week = get_week_key(closed + timedelta(days=7))
+    week_start, week_end = get_week_start_end(closed)
+    week, still_open = shift_index.close_slot(day, tuple(end), next_week)
+    for (chat, time), username in still_open.items():
+        try:
+            miss_record = {
+                "user": username,
+                "day": day,
+                "time": time,
+                "timestamp": now.isoformat()
+            }
+            async with chat_locks.hold(chat):
+                missed = repo.add_miss(chat, week, week_start, week_end, miss_record)
+            if missed:
+                logger.info(f"Marked @{username} as missed for {day} {time} in chat {chat}")
+        except Exception as e:
+            logger.error(f"❌ Error recording missed shift for chat {chat}: {e}")
+
+async def rollover_job():
+    """Move every chat on to this week's schedule, keeping last week's, and
+    archive the weeks before that"""
+    week = get_week_key()
+    rolled = archived = 0
+    for chat in owned_chats():
+        async with chat_locks.hold(chat):
+            rolled += repo.roll_over(chat, week)
+            archived += await repo.archive_weeks(chat, week)
+    logger.info(f"Rolled {rolled} chats over to {week}, archived {archived} weeks")
+
+def schedule_jobs():
+    """The weekly rollover, plus a reminder job per day and distinct reminder
+    time and a sweep job per day and distinct shift end across all chats;
+    jobs no chat needs any more are dropped. Jobs already in the job store
+    are kept as they are, so runs missed while the bot was down still
+    catch up."""
+    wanted = {"rollover": (rollover_job, {"day_of_week": "mon", "hour": 0, "minute": 0}, [], None)}
+    for day in DAYS:
+        weekday = day[:3].lower()
+        for at in reminder_index.fire_times() | {reminder_time(s) for s in DEFAULT_SLOTS}:
+            wanted[job_id("remind", day, at)] = (send_reminder_job, {"day_of_week": weekday, "hour": at[0], "minute": at[1]},
+                                                 [day, at], REMINDER_MISFIRE_GRACE)
+        for at in shift_index.end_times() | {end_time(s) for s in DEFAULT_SLOTS}:
+            wanted[job_id("sweep", day, at)] = (sweep_missed_job, {"day_of_week": weekday, "hour": at[0], "minute": at[1]},
+                                                [day, at], SWEEP_MISFIRE_GRACE)
+    for job in scheduler.get_jobs():
+        if job.id not in wanted:
+            job.remove()
+        elif job.misfire_grace_time != wanted[job.id][3]:
+            job.modify(misfire_grace_time=wanted[job.id][3])
+    for key, (func, when, args, grace) in wanted.items():
+        if scheduler.get_job(key) is None:
+            scheduler.add_job(func, trigger="cron", args=args, id=key, misfire_grace_time=grace, **when)
+            logger.info(f"Scheduled {key}")
+
+async def slots(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = chat_of(update)
+    args = context.args
+
+    if not args:
+        message = "🕒 Shift slots:\n\n"
+        for slot in repo.slots(chat):
+            (end_hour, end_minute), (hour, minute) = end_time(slot), reminder_time(slot)
+            message += (f"{slot['name'].capitalize()}: {slot['start']}–{end_hour:02d}:{end_minute:02d}, "
+                        f"reminder at {hour:02d}:{minute:02d}\n")
+        await update.message.reply_text(message)
+        return
+
+    action = args[0].lower()
     try:
-        data = load_data()
-        username = data["assignments"][day][time]
-        
-        if not username:
-            logger.info(f"No user assigned for {day} {time}")
+        if action == "add" and len(args) in (4, 5):
+            new_slot = make_slot(*args[1:])
+            name = new_slot["name"]
+        elif action == "remove" and len(args) == 2:
+            name = args[1].lower()
+        else:
+            await update.message.reply_text(
+                "Usage: /slots\n"
+                "/slots add <name> <HH:MM> <minutes> [<reminder offset minutes>]\n"
+                "/slots remove <name>")
             return
-            
-        user_obj = next((u for u in data["users"] if u["username"] == username), None)
-        if user_obj:
-            user_id = user_obj["user_id"]
-            message = f"⏰ Reminder: You are assigned to the {time} shift on {day}. Please reply with /done after completing it."
-            
-            await application.bot.send_message(chat_id=user_id, text=message)
-            logger.info(f"✅ Sent reminder to user ID {user_id} ({username})")
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+
+    error = None
+    async with chat_locks.hold(chat):
+        current = repo.slots(chat)
+        updated = [s for s in current if s["name"] != name]
+        if action == "add":
+            updated.append(new_slot)
+        updated.sort(key=lambda s: s["start"])
+        if action == "remove" and len(updated) == len(current):
+            error = f"❌ There is no {name} slot."
+        elif not updated:
+            error = "❌ A chat needs at least one slot."
+        elif len(updated) > MAX_SLOTS:
+            error = f"❌ A chat can have at most {MAX_SLOTS} slots."
         else:
-            logger.warning(f"User {username} not found in users list")
-            
-    except Exception as e:
-        logger.error(f"❌ Error sending reminder: {e}")
+            repo.set_slots(chat, updated)
 
-def schedule_reminders(application: Application):
-    scheduler.remove_all_jobs()
-    for day in DAYS:
-        for time in TIMES:
-            hour = 8 if time == "morning" else 16  # 8 AM for morning, 8 PM for night
-            minute = 13
-            
-            # Map day names to cron day numbers
-            day_mapping = {
-                "Monday": "mon", "Tuesday": "tue", "Wednesday": "wed", 
-                "Thursday": "thu", "Friday": "fri", "Saturday": "sat", "Sunday": "sun"
-            }
-            
-            scheduler.add_job(
-                send_reminder_job,
-                trigger="cron",
-                day_of_week=day_mapping[day],
-                hour=hour,
-                minute=minute,
-                args=[application, day, time],
-                id=f"{day}-{time}"
-            )
-            logger.info(f"Scheduled reminder for {day} {time} at {hour}:{minute:02d}")
+    if error:
+        await update.message.reply_text(error)
+        return
+
+    # A new reminder or end time may need its own job
+    schedule_jobs()
+    await update.message.reply_text(f"✅ Slots are now: {slot_choices(chat)}")
+
+def owned_chats():
+    """Stored chats this process handles: all of them, or its shard's"""
+    chats = repo.chat_ids()
+    if shard is None:
+        return chats
+    ring, index = shard
+    return [chat for chat in chats if ring.shard(chat) == index]
+
+def load_indexes():
+    """Build the in-memory shift indexes in one pass over all chats"""
+    shift_index.reset(due_week)
+    for chat in owned_chats():
+        shift_index.load_chat(repo, chat)
+        reminder_index.load_chat(repo, chat)
+
+def instrumented(name, callback):
+    """Handler that counts calls and errors and times a sample of them"""
+    @functools.wraps(callback)
+    async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        METRICS.count("chorebot_handler_calls_total", handler=name)
+        try:
+            with METRICS.timer("chorebot_handler_seconds", handler=name):
+                return await callback(update, context)
+        except Exception:
+            METRICS.count("chorebot_handler_errors_total", handler=name)
+            raise
+    return handler
+
+def record_job_run(event):
+    """Scheduler listener: how late each job started, and runs skipped entirely"""
+    job = event.job_id.split("-")[0]
+    if event.code == EVENT_JOB_MISSED:
+        # Too late even for the misfire grace time, e.g. after a long downtime
+        METRICS.count("chorebot_job_missed_total", job=job)
+        logger.warning(f"Skipped {event.job_id} due at {event.scheduled_run_time}: too late to run")
+        return
+    now = datetime.now(tz)
+    for run_time in event.scheduled_run_times:
+        METRICS.observe("chorebot_job_lag_seconds", (now - run_time).total_seconds(), job=job)
+
+def collect_gauges():
+    yield "chorebot_send_queue_depth", {}, dispatcher.queue.qsize()
+    yield "chorebot_scheduled_jobs", {}, len(scheduler.get_jobs())
+
+def build_application(token, base_url=None, request=None):
+    """The application with every handler registered; base_url points it at
+    another Bot API server and request replaces its HTTP client"""
+    builder = ApplicationBuilder().token(token).concurrent_updates(CONCURRENT_UPDATES)
+    if base_url:
+        builder = builder.base_url(base_url)
+    if request:
+        builder = builder.request(request)
+    app = builder.build()
+
+    # Add command handlers, each timed under its own name
+    handlers = {
+        "start": start,
+        "join": join,
+        "setshift": setshift,
+        "viewshifts": viewshifts,
+        "autoschedule": autoschedule,
+        "done": done,
+        "notavailable": notavailable,
+        "take": take,
+        "slots": slots,
+        "stats": stats,
+        "weeklyreport": weeklyreport,
+    }
+    for command, callback in handlers.items():
+        app.add_handler(CommandHandler(command, instrumented(command, callback)))
+    app.add_handler(CallbackQueryHandler(instrumented("button_callback", button_callback)))
+    return app
+
+def legacy_users(path=LEGACY_DATA_FILE):
+    """Members of the single rotation in path; [] if it is missing or holds none"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    users = data.get("users") if isinstance(data, dict) else None
+    return users if isinstance(users, list) else []
+
+async def start_bot(app):
+    """Open storage, catch up on what was missed, start the jobs and the
+    application; updates put on app.update_queue are then handled"""
+    # Open storage once before handling any update
+    repo.open()
+    if legacy_users() and not repo.chat_ids():
+        logger.warning(f"{LEGACY_DATA_FILE} holds a rotation from before per-chat state and is not read; "
+                       f"import it with: python migrate.py --import <chat_id>")
+    # Catch up on any week boundary passed while the bot was down
+    await rollover_job()
+    # Jobs come back from the job store; nothing runs until resume(), and
+    # the shift index needs to know which sweeps are still to catch up
+    scheduler.start(paused=True)
+    load_indexes()
+
+    # Schedule reminders and missed-shift sweeps not in the job store yet,
+    # then run whatever came due while the bot was down
+    schedule_jobs()
+    scheduler.add_listener(record_job_run, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
+    scheduler.resume()
+
+    await app.initialize()
+    await app.start()
+    dispatcher.start(app.bot)
+
+async def stop_bot(app):
+    """Finish the updates already queued, then stop jobs and sends and close storage"""
+    scheduler.shutdown()
+    await app.stop()
+    await dispatcher.stop()
+    await app.shutdown()
+    await repo.close()
+
+async def start_intake(app):
+    """Start putting updates on app.update_queue, from a webhook or by long
+    polling; returns the WebhookServer, if any"""
+    if UPDATE_MODE == "webhook":
+        webhook = WebhookServer(app, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                                WEBHOOK_SECRET or secrets.token_urlsafe(32))
+        await webhook.start(WEBHOOK_URL)
+        return webhook
+    await app.updater.start_polling()
+    return None
+
+async def stop_intake(app, webhook):
+    if webhook:
+        await webhook.stop()
+    else:
+        await app.updater.stop()
+
+def route_key(update: Update):
+    """What an update is sharded on: its chat, else its sender"""
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return 0
+
+async def route_updates(app, pool):
+    """Hand every update the receiver takes in to the worker owning its chat,
+    until None is queued"""
+    while (update := await app.update_queue.get()) is not None:
+        await pool.dispatch(route_key(update), update.to_dict())
+
+def next_updates(updates):
+    """Wait for the next update dict, then take whatever else is already
+    queued; a receiver process that died without stopping us reads as None"""
+    while True:
+        try:
+            batch = [updates.get(timeout=1)]
+            break
+        except queue.Empty:
+            if not multiprocessing.parent_process().is_alive():
+                return [None]
+    try:
+        while batch[-1] is not None:
+            batch.append(updates.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+def worker_process(index, workers, updates, ready, token, base_url=None, metrics_port=0):
+    """Entry point of a worker process in the sharded mode"""
+    # The receiver stops its workers through their queues; a Ctrl-C sent to
+    # the whole process group must not cut them short
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(run_worker(index, workers, updates, ready, token, base_url, metrics_port))
+
+async def run_worker(index, workers, updates, ready, token, base_url, metrics_port):
+    """Handle the updates of shard index of workers until None is queued;
+    metrics_port is the first worker's, 0 for none"""
+    global shard, dispatcher
+    shard = (HashRing(workers), index)
+    # Telegram's overall send limit is shared by all the workers
+    dispatcher = Dispatcher(workers=SEND_WORKERS, global_rate=SEND_GLOBAL_RATE / workers,
+                            per_chat_rate=SEND_PER_CHAT_RATE)
+    # Each worker keeps its own jobs; they only visit the worker's chats
+    base, ext = os.path.splitext(JOBS_FILE)
+    scheduler.remove_jobstore("default")
+    scheduler.add_jobstore(SqliteJobStore(f"{base}.{index}{ext}"), "default")
+
+    app = build_application(token, base_url=base_url)
+    await start_bot(app)
+    metrics_server = None
+    if metrics_port:
+        METRICS.add_collector(collect_gauges)
+        metrics_server = METRICS.server(METRICS_LISTEN, metrics_port + index)
+        await metrics_server.start()
+    ready.set()
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            for data in await loop.run_in_executor(None, next_updates, updates):
+                if data is None:
+                    # Everything sent here is handled before the worker stops
+                    await app.update_queue.join()
+                    return
+                await app.update_queue.put(Update.de_json(data, app.bot))
+    finally:
+        await stop_bot(app)
+        if metrics_server:
+            await metrics_server.stop()
 
 async def main():
+    if UPDATE_MODE == "webhook" and not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL must be set when UPDATE_MODE is 'webhook'")
+
     # Build the application
-    app = ApplicationBuilder().token("7803750356:AAHM0upUy91CFZ2EigRxd6lPKXWTWkVcl40").build()
+    app = build_application("7803750356:AAHM0upUy91CFZ2EigRxd6lPKXWTWkVcl40")
     
     # Set up bot commands menu
     from telegram import BotCommand
     commands = [
         BotCommand("start", "Start the bot and get welcome message"),
         BotCommand("join", "Join the chore rotation"),
-        BotCommand("autoschedule", "Auto-assign shifts to all users"),
+        BotCommand("autoschedule", "Auto-assign shifts to all users (optionally for several weeks)"),
         BotCommand("setshift", "Manually assign a shift (day time @username)"),
-        BotCommand("viewshifts", "View the current week's schedule"),
+        BotCommand("viewshifts", "View this week's schedule, or another week's"),
         BotCommand("done", "Mark your shift as completed"),
         BotCommand("notavailable", "Mark yourself unavailable for today"),
         BotCommand("take", "Take over an unassigned shift (day time)"),
-        BotCommand("stats", "View completion statistics"),
+        BotCommand("slots", "List or change this chat's shift slots"),
+        BotCommand("stats", "View completion statistics (optionally for a week range)"),
         BotCommand("weeklyreport", "Generate weekly completion report")
     ]
-    
-    # Add command handlers
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("join", join))
-    app.add_handler(CommandHandler("setshift", setshift))
-    app.add_handler(CommandHandler("viewshifts", viewshifts))
-    app.add_handler(CommandHandler("autoschedule", autoschedule))
-    app.add_handler(CommandHandler("done", done))
-    app.add_handler(CommandHandler("notavailable", notavailable))
-    app.add_handler(CommandHandler("take", take))
-    app.add_handler(CommandHandler("stats", stats))
-    app.add_handler(CommandHandler("weeklyreport", weeklyreport))
-    app.add_handler(CallbackQueryHandler(button_callback))
-    
-    # Schedule reminders
-    schedule_reminders(app)
-    scheduler.start()
-    
-    # Start the bot
-    await app.initialize()
-    await app.start()
+
+    pool = None
+    if WORKERS > 1:
+        # Storage, jobs and handlers live in the workers; this process only
+        # takes updates in and routes them
+        pool = WorkerPool(worker_process, WORKERS,
+                          args=(app.bot.token, None, METRICS_PORT and METRICS_PORT + 1))
+        await pool.start()
+        await app.initialize()
+        router = asyncio.create_task(route_updates(app, pool))
+    else:
+        await start_bot(app)
+
+    metrics_server = None
+    if METRICS_PORT:
+        if pool is None:
+            METRICS.add_collector(collect_gauges)
+        metrics_server = METRICS.server(METRICS_LISTEN, METRICS_PORT)
+        await metrics_server.start()
     
     # Set bot commands menu
     await app.bot.set_my_commands(commands)
     
-    await app.updater.start_polling()
-    
-    # Keep the bot running
+    webhook = await start_intake(app)
+    
+    # Keep the bot running until SIGINT/SIGTERM
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    if pool:
+        workers = WORKERS
+        resizing = set()
+
+        def reshard(delta):
+            nonlocal workers
+            workers = max(1, workers + delta)
+            task = asyncio.create_task(pool.resize(workers))
+            resizing.add(task)
+            task.add_done_callback(resizing.discard)
+
+        loop.add_signal_handler(signal.SIGUSR1, reshard, 1)
+        loop.add_signal_handler(signal.SIGUSR2, reshard, -1)
     try:
-        while True:
-            await asyncio.sleep(1)
-    except KeyboardInterrupt:
-        logger.info("Bot stopped by user")
+        await stopping.wait()
+        logger.info("Bot stopping")
     finally:
-        scheduler.shutdown()
-        await app.updater.stop()
-        await app.stop()
-        await app.shutdown()
+        # Stop taking updates first, then finish the ones already queued
+        await stop_intake(app, webhook)
+        if pool:
+            await app.update_queue.put(None)
+            await router
+            await pool.stop()
+            await app.shutdown()
+        else:
+            await stop_bot(app)
+        if metrics_server:
+            await metrics_server.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
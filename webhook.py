@@ -0,0 +1,69 @@
+import hmac
+import json
+import logging
+from http import HTTPStatus
+
+from telegram import Update
+
+from httpserver import HttpServer
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookServer:
+    """Receives updates Telegram POSTs to the bot and feeds them to the application.
+
+    Requests must carry the secret token registered with set_webhook() in
+    X-Telegram-Bot-Api-Secret-Token, so only Telegram can inject updates.
+    An update is acknowledged once it is on the application's update queue;
+    the handlers run as they do for polling.
+    """
+
+    def __init__(self, app, listen, port, path, secret_token):
+        self.app = app
+        self.path = path
+        self.secret_token = secret_token.encode()
+        self.http = HttpServer(self._handle, listen, port)
+        self.received = 0
+        self.rejected = 0
+
+    @property
+    def port(self):
+        return self.http.port
+
+    async def start(self, webhook_url, drop_pending_updates=False):
+        """Listen, then point Telegram at webhook_url (which must reach self.path)."""
+        await self.http.start()
+        await self.app.bot.set_webhook(url=webhook_url, secret_token=self.secret_token.decode(),
+                                       allowed_updates=Update.ALL_TYPES,
+                                       drop_pending_updates=drop_pending_updates)
+        logger.info("Webhook listening on %s:%s%s", self.http.host, self.port, self.path)
+
+    async def stop(self, timeout=10):
+        # The webhook stays registered: Telegram holds updates until we are back
+        await self.http.stop(timeout)
+
+    async def _handle(self, method, path, headers, body):
+        if path.split("?", 1)[0] != self.path:
+            return HTTPStatus.NOT_FOUND, b""
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, b""
+        token = headers.get("x-telegram-bot-api-secret-token", "").encode("latin-1")
+        if not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            logger.warning("Rejected webhook request with a wrong secret token")
+            return HTTPStatus.FORBIDDEN, b""
+        try:
+            data = json.loads(body)
+            # de_json gives None for an empty object, which the router would
+            # take for its stop signal
+            update = Update.de_json(data, self.app.bot) if isinstance(data, dict) else None
+        except (ValueError, TypeError, KeyError, AttributeError):
+            update = None
+        if not isinstance(update, Update):
+            self.rejected += 1
+            logger.warning("Rejected malformed webhook update")
+            return HTTPStatus.BAD_REQUEST, b""
+        self.received += 1
+        await self.app.update_queue.put(update)
+        return HTTPStatus.OK, b""